@@ -1,27 +1,143 @@
-import base64
 import asyncio
+import hmac
 import time
 import math
 import logging
 import os
-import json
+import random
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Header, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Dict, Optional
-from openai import OpenAI
 from dotenv import load_dotenv
 
-from .services.rubric_evaluator import generate_system_prompt
-
-
-load_dotenv()
+from .services.rubric_evaluator import (
+    generate_criterion_prompt,
+    generate_system_prompt,
+    get_criteria,
+    get_rubric_version,
+    overall_band,
+)
+from .services.admission import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    AdmissionRejectedError,
+    set_request_context,
+)
+from .services.cascade import CascadeConfig, CascadeStats, escalation_reasons
+from .services.env import env_float, env_int
+from .services.evaluation_cache import get_cache, make_cache_key
+from .services.fast_json import (
+    FastJSONResponse,
+    dumps_with,
+    extend_json,
+    loads,
+    model_response,
+    raw_json_response,
+)
+from .services.prescreen import EssayRejectedError, count_words, essay_word_count, screen_essay
+from .services.job_queue import FINISHED, QueueFullError, create_job_queue, job_db_path
+from .services.image_ingest import UnsupportedImageError, ingest_data, ingest_upload, read_upload
+from .services.uploads import UploadTooLargeError
+from .services.transcription import stitch_transcripts, transcribe_pages, transcript_topic, transcription_flights
+from .services.token_budget import (
+    CRITERION_OUTPUT_TOKENS,
+    EVALUATION_OUTPUT_TOKENS,
+    InputTooLargeError,
+    check_essay,
+    load_encodings,
+    output_tokens,
+    preload_encodings,
+    schema_tokens,
+)
+from .services.single_flight import SingleFlight
+from .services.metrics import PROMETHEUS_CONTENT_TYPE, RequestMetricsMiddleware, render_metrics, timed_stage
+from .services.payload_log import log_payload, logger
+from .services.resilience import is_invalid_output
+from .services.openai_client import (
+    UpstreamAPIError,
+    UpstreamBusyError,
+    UpstreamTimeoutError,
+    UpstreamUnavailableError,
+    circuit_is_open,
+    parse_completion,
+    stream_parsed_completion,
+    warm_up,
+)
+from .services.streaming import NDJSON_MEDIA_TYPE, PartialFieldTracker, ndjson_line
+from .services.batch_runner import batch_concurrency, parse_batch_lines, read_batch_upload, run_batch
+
+
+# On Vercel the environment comes from the project settings; skip the .env lookup
+if not os.environ.get("VERCEL"):
+    load_dotenv()
 
 ### Create FastAPI instance with custom docs and openapi url
 app = FastAPI(title="IELTS Examiner API",
               docs_url="/api/py/docs", 
-              openapi_url="/api/py/openapi.json")
+              openapi_url="/api/py/openapi.json",
+              default_response_class=FastJSONResponse)
+app.add_middleware(RequestMetricsMiddleware)
+
+
+@app.exception_handler(UpstreamBusyError)
+async def upstream_busy_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
+
+@app.exception_handler(AdmissionRejectedError)
+async def admission_rejected_handler(request, exc):
+    return JSONResponse(
+        status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request, exc):
+    return JSONResponse(
+        status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+
+@app.exception_handler(UpstreamUnavailableError)
+async def upstream_unavailable_handler(request, exc):
+    return JSONResponse(
+        status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+
+@app.exception_handler(UpstreamAPIError)
+async def upstream_error_handler(request, exc):
+    logger.warning("OpenAI API Error: %s", exc)
+    return JSONResponse(status_code=502, content={"detail": "The model provider returned an error, please retry."})
+
+
+@app.exception_handler(UpstreamTimeoutError)
+async def upstream_timeout_handler(request, exc):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+@app.exception_handler(UploadTooLargeError)
+async def upload_too_large_handler(request, exc):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+@app.exception_handler(InputTooLargeError)
+async def input_too_large_handler(request, exc: InputTooLargeError):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+@app.exception_handler(EssayRejectedError)
+async def essay_rejected_handler(request, exc: EssayRejectedError):
+    return JSONResponse(
+        status_code=422, content={"detail": str(exc), "reason": exc.reason, "features": exc.features}
+    )
+
+
+@app.exception_handler(UnsupportedImageError)
+async def unsupported_image_handler(request, exc):
+    return JSONResponse(status_code=415, content={"detail": str(exc)})
 
 
 @app.get("/api/py/helloFastApi")
@@ -43,11 +159,6 @@ class EssayResponse(BaseModel):
     scores: Dict[str, float]
     feedback: Dict[str, str]
 
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),  # This is the default and can be omitted
-)   
-
-
 # Define Pydantic models
 class Score(BaseModel):
     overall_band: float
@@ -76,268 +187,799 @@ class IELTSWritingEvaluation(BaseModel):
         cls, topic:str, essay_text: str, scores: Dict[str, float], feedback: Dict[str, str], suggestions: List[str]
     ) -> "IELTSWritingEvaluation":
         """Factory method to compute word count and overall band dynamically"""
-        word_count = len(essay_text.split())
-
-        # Compute overall band score using IELTS rounding rules
-        avg_score = sum(scores.values()) / len(scores)
-        decimal_part = avg_score - math.floor(avg_score)
-
-        if decimal_part < 0.25:
-            overall_band = math.floor(avg_score)
-        elif decimal_part >= 0.75:
-            overall_band = math.ceil(avg_score)
-        else:
-            overall_band = math.floor(avg_score) + 0.5
+        word_count = count_words(essay_text)
 
         return cls(
             topic=topic,
             word_count=word_count,
-            score=Score(overall_band=overall_band, **scores),
+            score=Score(overall_band=overall_band(scores.values()), **scores),
             feedback=Feedback(**feedback),
             suggestions=suggestions,
+            original_essay=essay_text,
             error=None  # No error in a successful response
         )
 
+
+class CriterionEvaluation(BaseModel):
+    score: float
+    feedback: str
+    suggestions: List[str]
+
+
+class TaskResponseEvaluation(CriterionEvaluation):
+    topic: str
+
+
+class FastTierEvaluation(IELTSWritingEvaluation):
+    """Fast-tier output: a full evaluation plus the model's confidence in its scores."""
+    confidence: float = Field(description="Confidence in the band scores, from 0 (guessing) to 1 (certain).")
+
+
+class ScreeningWarning(BaseModel):
+    code: str
+    message: str
+
+
+class EssayScreening(BaseModel):
+    """The pre-screen's text features of an essay and its warnings."""
+    features: Dict[str, float]
+    warnings: List[ScreeningWarning]
+
+
+class EvaluationResponse(IELTSWritingEvaluation):
+    """An evaluation as the JSON endpoints return it, with the essay's pre-screen."""
+    screening: Optional[EssayScreening] = None
+
+
 class EssayInput(BaseModel):
     essay_text: str
 
 
-def process_ielts_essay(essay_text: str):
-    """Evaluates the IELTS essay and returns structured scores and feedback."""
-    if not essay_text.strip():
-        raise HTTPException(status_code=400, detail="Essay text cannot be empty.")
+ESSAY_MODEL = "gpt-4o"
+VISION_MODEL = "gpt-4o-mini"
+# "single": one call scores every criterion; "per_criterion": one smaller call
+# per criterion, run concurrently and merged through `from_essay`; "cascade":
+# a fast model first, escalating to ESSAY_MODEL when a routing rule fires.
+EVALUATION_MODES = ("single", "per_criterion", "cascade")
+# Bump when a prompt changes so cached evaluations from the old prompt are ignored.
+PROMPT_VERSION = "4"
+
+
+essay_flights = SingleFlight()
+cascade_stats = CascadeStats()
+# Background tasks (cascade audits, warm-up), referenced until they finish
+_background_tasks = set()
+
+
+def evaluation_mode():
+    """EVALUATION_MODE, falling back to "single" when the rubric's criteria don't match the score fields."""
+    mode = os.environ.get("EVALUATION_MODE", "single")
+    if mode == "per_criterion" and set(get_criteria()) != set(Feedback.model_fields):
+        return "single"
+    return mode if mode in EVALUATION_MODES else "single"
+
+
+def evaluation_version():
+    """Version tag for cache keys: prompt revision plus active rubric."""
+    return f"{PROMPT_VERSION}-{get_rubric_version()}"
+
+
+# Static instructions come first so every request shares the same prompt
+# prefix (system prompt + this text); only the essay varies at the end.
+ESSAY_USER_PROMPT = """Please evaluate my IELTS writing task. The input contains:
+1. **Topic/Question** (First part of the text, if available).
+2. **Essay Response** (Following text).
+
+If no topic is found, **generate a relevant topic based on the essay**.
+
+Here is the full input (topic + essay):
+---
+"""
+
+
+CRITERION_USER_PROMPT = """Please score my IELTS writing task. The input contains the topic/question
+(first part of the text, if available) followed by the essay.
+
+Here is the full input (topic + essay):
+---
+"""
+
+
+def _screening_note(screening) -> str:
+    # After the essay, so the static prompt prefix stays shared
+    return screening.prompt_note() + "\n" if screening is not None else ""
+
+
+def essay_messages(essay_text: str, screening=None):
+    """Chat messages for scoring a text essay, with the pre-screen's statistics after it."""
+    return [
+        {"role": "system",
+         "content": generate_system_prompt()},
+        {"role": "user",
+         "content": ESSAY_USER_PROMPT + essay_text + "\n---\n" + _screening_note(screening)}
+    ]
+
 
+def evaluation_max_tokens(essay_text: str) -> int:
+    """Completion budget for a full evaluation, which repeats the essay in `original_essay`."""
+    return output_tokens(EVALUATION_OUTPUT_TOKENS, essay_text, ESSAY_MODEL)
+
+
+def admission_context(request: Request, priority=PRIORITY_INTERACTIVE):
+    """Queues this request's upstream calls under its tenant (X-Tenant-ID, else client address)."""
+    tenant = request.headers.get("x-tenant-id") or (request.client.host if request.client else None)
+    set_request_context(tenant, priority)
+    return tenant
+
+
+async def transcribe_uploads(files) -> str:
+    """
+    Ingests uploaded page images and returns their transcript as one
+    "topic + essay" text. Pages are transcribed concurrently; transcripts are
+    cached by image hash, so re-scoring never repeats the vision call.
+    """
+    images = await asyncio.gather(*[ingest_upload(file) for file in files])
+    return await transcribe_images(images)
+
+
+async def transcribe_images(images) -> str:
+    """Transcribes already ingested page images into one "topic + essay" text."""
+    return stitch_transcripts(await read_transcripts(images))
+
+
+async def read_transcripts(images):
+    """Transcribes already ingested page images, returning the page transcripts in order."""
+    try:
+        transcripts = await transcribe_pages(images, VISION_MODEL)
+    except (UpstreamBusyError, UpstreamTimeoutError, UpstreamUnavailableError, UpstreamAPIError,
+            AdmissionRejectedError):
+        # Provider failures (SDK errors arrive as UpstreamAPIError) get their 502/503/504 handlers
+        raise
+    except Exception:
+        logger.exception("Transcription failed")
+        raise HTTPException(status_code=500, detail="Error processing image.")
+    if not any(t.essay.strip() for t in transcripts):
+        raise HTTPException(status_code=422, detail="No essay text could be read from the image(s).")
+    return transcripts
+
+
+async def cache_result(result: IELTSWritingEvaluation, cache_key: str):
+    """Caches a successful evaluation."""
+    if result.error is None:
+        with timed_stage("serialize"):
+            payload = result.model_dump_json()
+        await get_cache().set(cache_key, payload)
+
+
+def count_essay_words(result: IELTSWritingEvaluation, essay_text: str):
+    """
+    Replaces the model's word count with the pre-screen's: the essay without
+    its task question, so it matches `screening.features.word_count`.
+    """
+    result.word_count = essay_word_count(essay_text)
+    return result
+
+
+async def score_essay(essay_text: str, cache_key: str, screening=None):
+    """Runs the scoring call for one essay and caches a successful result."""
     start_time = time.time()
-    print("Generating system prompt...")
-    system_prompt = generate_system_prompt()
-
-    completion = client.beta.chat.completions.parse(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", 
-             "content": system_prompt},
-            {"role": "user", 
-             "content": f""" 
-               Please evaluate my IELTS writing task. The input contains:
-                1. **Topic/Question** (First part of the text, if available).
-                2. **Essay Response** (Following text).
-
-                Your task:
-                - Identify and extract the **topic/question** if present.
-                - If no topic is found, **generate a relevant topic based on the essay**.
-                - Evaluate the **essay content** based on the official IELTS writing band descriptors.
-                - Provide structured **scores, feedback, and suggestions** for improvement.
-
-                Here is the full input (topic + essay):
-                ---
-                {essay_text}
-                ---
-                """}
-        ],
+    with timed_stage("prompt_build"):
+        messages = essay_messages(essay_text, screening)
+    completion = await parse_completion(
+        stage="score",
+        model=ESSAY_MODEL,
+        messages=messages,
         response_format=IELTSWritingEvaluation,
+        max_tokens=evaluation_max_tokens(essay_text),
     )
-    result = completion.choices[0].message.parsed
+    result = count_essay_words(completion.choices[0].message.parsed, essay_text)
     # result.original_essay = essay_text  # Attach original essay
-    
-    print(f"IELTS Writing Evaluation Result: {result.model_dump_json(indent=4)}")
+    await cache_result(result, cache_key)
+
+    log_payload("IELTS Writing Evaluation Result:", result)
     execution_time = time.time() - start_time
-    print(f"Essay Processing Time: {execution_time:.2f} seconds")
+    logger.info("Essay Processing Time: %.2f seconds", execution_time)
+    return result
+
+
+def criterion_messages(key: str, essay_text: str, screening=None):
+    """Chat messages for scoring one criterion, with only that criterion's rubric slice."""
+    return [
+        {"role": "system",
+         "content": generate_criterion_prompt(key)},
+        {"role": "user",
+         "content": CRITERION_USER_PROMPT + essay_text + "\n---\n" + _screening_note(screening)}
+    ]
+
+
+def _essay_body(topic: str, essay_text: str) -> str:
+    """The essay without its leading topic line(s), when the topic was copied verbatim."""
+    stripped = essay_text.strip()
+    if topic and stripped.startswith(topic.strip()):
+        return stripped[len(topic.strip()):].strip()
+    return stripped
+
+
+async def score_essay_by_criterion(essay_text: str, cache_key: str, screening=None):
+    """
+    Scores each rubric criterion in its own concurrent call and merges the
+    results through `IELTSWritingEvaluation.from_essay`, so word count and
+    overall band are computed locally. Latency is that of the slowest call.
+    """
+    start_time = time.time()
+    criteria = get_criteria()
+    with timed_stage("prompt_build"):
+        requests = [(key, criterion_messages(key, essay_text, screening)) for key in criteria]
+    completions = await asyncio.gather(*[
+        parse_completion(
+            stage="score",
+            model=ESSAY_MODEL,
+            messages=messages,
+            response_format=TaskResponseEvaluation if key == "task_response" else CriterionEvaluation,
+            max_tokens=output_tokens(CRITERION_OUTPUT_TOKENS),
+        )
+        for key, messages in requests
+    ])
+    parsed = {key: completion.choices[0].message.parsed for key, completion in zip(criteria, completions)}
+    missing = [key for key, value in parsed.items() if value is None]
+    if missing:
+        raise ValueError(f"The model returned no score for {', '.join(missing)}.")
+
+    topic = getattr(parsed.get("task_response"), "topic", "")
+    result = IELTSWritingEvaluation.from_essay(
+        topic=topic,
+        essay_text=_essay_body(topic, essay_text),
+        scores={key: value.score for key, value in parsed.items()},
+        feedback={key: value.feedback for key, value in parsed.items()},
+        suggestions=[suggestion for value in parsed.values() for suggestion in value.suggestions],
+    )
+    count_essay_words(result, essay_text)
+    await cache_result(result, cache_key)
+
+    log_payload("IELTS Writing Evaluation Result:", result)
+    logger.info("Essay Processing Time (per criterion): %.2f seconds", time.time() - start_time)
+    return result
+
+
+async def _score_with(model: str, messages, response_format, max_tokens=None):
+    """One scoring call; returns None when the output fails validation."""
+    try:
+        completion = await parse_completion(
+            stage="score", model=model, messages=messages, response_format=response_format, max_tokens=max_tokens
+        )
+    except Exception as e:
+        if not (isinstance(e, ValidationError) or is_invalid_output(e)):
+            raise
+        logger.info("%s output failed validation: %s", model, e)
+        return None
+    return completion.choices[0].message.parsed
+
+
+async def _audit_fast_result(model: str, messages, max_tokens: int, fast_overall: float):
+    """Scores an accepted fast-tier essay with the strong model too, to measure agreement."""
+    set_request_context("cascade-audit", PRIORITY_BATCH)
+    try:
+        strong = await _score_with(model, messages, IELTSWritingEvaluation, max_tokens)
+    except Exception as e:
+        logger.info("Cascade audit failed: %s", e)
+        return
+    if strong is not None and strong.error is None:
+        cascade_stats.record_comparison(fast_overall, strong.score.overall_band)
+
+
+async def score_essay_cascade(essay_text: str, cache_key: str, screening=None):
+    """
+    Scores with the fast model and returns its result unless an escalation
+    rule fires (failed validation, boundary scores, inconsistent criteria or
+    low confidence); then the strong model scores the essay. The tier that
+    answered, escalation reasons and tier agreement go to `cascade_stats`.
+    """
+    start_time = time.time()
+    config = CascadeConfig.from_env(ESSAY_MODEL)
+    with timed_stage("prompt_build"):
+        messages = essay_messages(essay_text, screening)
+    max_tokens = evaluation_max_tokens(essay_text)
+
+    fast = await _score_with(config.fast_model, messages, FastTierEvaluation, max_tokens)
+    if fast is None or fast.error is not None:
+        reasons = ["validation"]
+    else:
+        scores = fast.score.model_dump(exclude={"overall_band"})
+        reasons = escalation_reasons(scores, fast.score.overall_band, fast.confidence, config)
+
+    if not reasons:
+        tier, model = "fast", config.fast_model
+        result = IELTSWritingEvaluation.model_validate(fast.model_dump(exclude={"confidence"}))
+        audit_rate = env_float("CASCADE_AUDIT_RATE", 0.0)
+        if audit_rate and random.random() < audit_rate:
+            task = asyncio.ensure_future(
+                _audit_fast_result(config.strong_model, messages, max_tokens, fast.score.overall_band)
+            )
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+    else:
+        tier, model = "strong", config.strong_model
+        cascade_stats.record_escalation(reasons)
+        result = await _score_with(config.strong_model, messages, IELTSWritingEvaluation, max_tokens)
+        if result is None:
+            raise ValueError("The model returned an invalid evaluation.")
+        if "validation" not in reasons and result.error is None:
+            cascade_stats.record_comparison(fast.score.overall_band, result.score.overall_band)
+
+    cascade_stats.record_answer(tier, model)
+    count_essay_words(result, essay_text)
+    await cache_result(result, cache_key)
+    log_payload("IELTS Writing Evaluation Result:", result)
+    logger.info(
+        "Essay Processing Time (cascade, %s tier%s): %.2f seconds",
+        tier, f", escalated for {'/'.join(reasons)}" if reasons else "", time.time() - start_time,
+    )
     return result
 
-@app.post("/api/py/evaluate", response_model=IELTSWritingEvaluation)
-async def evaluate_ielts_essay(essay_text: Optional[str] = Form(None), file: Optional[UploadFile] = File(None)):
+
+async def lookup_evaluation(essay_text: str, screening=None):
+    """
+    Returns (mode, cache key, cached evaluation JSON or None, screening) for
+    an essay, raising EssayRejectedError when the pre-screen rejects it.
+    """
+    if not essay_text.strip():
+        raise HTTPException(status_code=400, detail="Essay text cannot be empty.")
+    check_essay(essay_text, ESSAY_MODEL)
+    if screening is None:
+        with timed_stage("prescreen"):
+            screening = screen_essay(essay_text)
+    screening.raise_if_rejected()
+
+    start_time = time.time()
+    mode = evaluation_mode()
+    # Modes produce different outputs, so they are cached separately
+    kind = "text" if mode == "single" else f"text-{mode}"
+    cache_key = make_cache_key(kind, essay_text, ESSAY_MODEL, evaluation_version())
+    # While the provider is failing, an expired evaluation beats an error
+    cached = await get_cache().get(cache_key, allow_stale=circuit_is_open(ESSAY_MODEL))
+    if cached is not None:
+        logger.info("Essay cache hit (%.3f seconds)", time.time() - start_time)
+    return mode, cache_key, cached, screening
+
+
+async def score_evaluation(essay_text: str, mode: str, cache_key: str, screening=None):
+    score = {"per_criterion": score_essay_by_criterion, "cascade": score_essay_cascade}.get(mode, score_essay)
+    # Identical essays submitted at the same time share one upstream call
+    return await essay_flights.do(cache_key, lambda: score(essay_text, cache_key, screening))
+
+
+async def process_ielts_essay(essay_text: str, screening=None):
+    """
+    Evaluates the IELTS essay and returns structured scores and feedback.
+    `screening` is the essay's pre-screen, when the caller already ran it.
+    """
+    mode, cache_key, cached, screening = await lookup_evaluation(essay_text, screening)
+    if cached is not None:
+        with timed_stage("parse"):
+            return IELTSWritingEvaluation.model_validate_json(cached)
+    return await score_evaluation(essay_text, mode, cache_key, screening)
+
+
+async def evaluation_response(essay_text: str):
+    """
+    process_ielts_essay for the JSON endpoints: a cache hit is sent exactly
+    as stored, and a fresh result is serialized once, without re-validation.
+    The pre-screen's features and warnings are added as `screening`.
+    """
+    mode, cache_key, cached, screening = await lookup_evaluation(essay_text)
+    if cached is not None:
+        return raw_json_response(extend_json(cached, screening=screening.to_dict()))
+    result = await score_evaluation(essay_text, mode, cache_key, screening)
+    with timed_stage("serialize"):
+        return model_response(result, screening=screening.to_dict())
+
+@app.post("/api/py/evaluate", response_model=EvaluationResponse)
+async def evaluate_ielts_essay(request: Request, essay_text: Optional[str] = Form(None),
+                               file: Optional[UploadFile] = File(None)):
     """Handles both text and image input for essay evaluation."""
     start_time = time.time()
     if not essay_text and not file:
         raise HTTPException(status_code=400, detail="Either text or an image file is required.")
+    admission_context(request)
 
     # If text is provided, evaluate it directly
     if essay_text:
-        return process_ielts_essay(essay_text)
+        return await evaluation_response(essay_text)
+
+    # If a file is uploaded, transcribe it with vision and score the transcript
+    essay_text = await transcribe_uploads([file])
+    result = await evaluation_response(essay_text)
+
+    execution_time = time.time() - start_time
+    logger.info("Essay Processing Time: %.2f seconds", execution_time)
+    return result
+
 
-    # If a file is uploaded, process it with GPT-4o Vision
+def stream_error(exc: Exception):
+    """
+    The `error` event for a failure once a stream has started, with the
+    detail the JSON endpoints' handlers would send. Provider error bodies and
+    unexpected exceptions are only logged.
+    """
+    if isinstance(exc, EssayRejectedError):
+        return {"type": "error", "detail": str(exc), "reason": exc.reason, "features": exc.features}
+    if isinstance(exc, HTTPException):
+        return {"type": "error", "detail": exc.detail}
+    if isinstance(exc, (UpstreamBusyError, UpstreamTimeoutError, UpstreamUnavailableError, AdmissionRejectedError,
+                        InputTooLargeError, UnsupportedImageError)):
+        return {"type": "error", "detail": str(exc)}
+    if isinstance(exc, UpstreamAPIError):
+        logger.warning("OpenAI streaming API Error: %s", exc)
+        return {"type": "error", "detail": "The model provider returned an error, please retry."}
+    logger.error("Streaming evaluation failed", exc_info=exc)
+    return {"type": "error", "detail": "Error evaluating essay."}
+
+
+async def stream_evaluation(cache_key: str, model: str, messages, max_tokens=None, essay_text="", screening=None):
+    """
+    Yields NDJSON events for one evaluation: the pre-screen's `screening`
+    event, a `field` event for each value as soon as it is settled in the
+    streamed output, then a `result` event with the validated
+    `IELTSWritingEvaluation` (or an `error` event). `word_count` is counted
+    locally, so its field event comes last.
+    """
+    start_time = time.time()
+    cache = get_cache()
+    tracker = PartialFieldTracker(skip=("word_count",))
+    if screening is not None:
+        yield ndjson_line({"type": "screening", **screening.to_dict()})
+
+    cached = await cache.get(cache_key, allow_stale=circuit_is_open(model))
+    if cached is not None:
+        data = loads(cached)
+        for event in tracker.finish(data):
+            yield ndjson_line(event)
+        yield ndjson_line({"type": "field", "path": "word_count", "value": data.get("word_count")})
+        yield dumps_with({"type": "result"}, data=cached) + b"\n"
+        return
+
+    result = None
+    first_field_time = None
+    try:
+        async for event in stream_parsed_completion(
+            model=model, messages=messages, response_format=IELTSWritingEvaluation, max_tokens=max_tokens
+        ):
+            if event.type == "content.delta":
+                for field in tracker.update(event.parsed):
+                    if first_field_time is None:
+                        first_field_time = time.time() - start_time
+                    yield ndjson_line(field)
+            elif event.type == "content.done":
+                result = event.parsed
+    except Exception as e:
+        yield ndjson_line(stream_error(e))
+        return
+
+    if result is None:
+        yield ndjson_line({"type": "error", "detail": "The model returned no evaluation."})
+        return
+
+    data = count_essay_words(result, essay_text).model_dump()
+    for field in tracker.finish(data):
+        yield ndjson_line(field)
+    yield ndjson_line({"type": "field", "path": "word_count", "value": data["word_count"]})
+    if result.error is None:
+        await cache.set(cache_key, result.model_dump_json())
+    yield ndjson_line({"type": "result", "data": data})
+
+    if first_field_time is not None:
+        logger.info("Essay Streaming Time to first field: %.2f seconds", first_field_time)
+    logger.info("Essay Processing Time: %.2f seconds", time.time() - start_time)
+
+
+def prepare_stream(essay_text: str):
+    """Checks and pre-screens an essay for streaming; returns (screening, cache_key, messages)."""
+    check_essay(essay_text, ESSAY_MODEL)
+    with timed_stage("prescreen"):
+        screening = screen_essay(essay_text)
+    screening.raise_if_rejected()
+    cache_key = make_cache_key("text", essay_text, ESSAY_MODEL, evaluation_version())
+    with timed_stage("prompt_build"):
+        messages = essay_messages(essay_text, screening)
+    return screening, cache_key, messages
+
+
+async def stream_image_evaluation(data: bytes, digest: str, filename=None):
+    """
+    Yields NDJSON events for an uploaded page image: a `status` event right
+    away, a `transcript` event with the page's topic once the vision call has
+    read it, then the events of `stream_evaluation` for the transcript.
+    """
+    yield ndjson_line({"type": "status", "status": "transcribing"})
     try:
-        contents = await file.read()
-        base64_image = base64.b64encode(contents).decode("utf-8")
-
-        vision_response =  client.beta.chat.completions.parse(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", 
-                 "content": """You are an advanced IELTS evaluator specializing in text extraction from images. Your task is to accurately extract the **IELTS Writing Task 2 topic and essay** from the provided image. Your response must strictly follow JSON format with no additional explanations, comments, or formatting outside of JSON.
-
-                    ### Extraction Guidelines:
-                    1. **Topic Detection**:
-                    - Identify and extract the **topic/question** if it is explicitly present in the image.
-                    - If no explicit topic is found, **generate a relevant topic based on the essay content**.
-                    - Ensure that the extracted topic/question is **precisely worded** and aligned with IELTS Writing Task 2 format.
-
-                    2. **Essay Extraction**:
-                    - Extract the full essay **without modifying the original text**.
-                    - Preserve paragraph structure and sentence integrity.
-                    ### **Your Tasks:**
-              
-
-                    3. **Evaluate the essay based on IELTS criteria:**
-                    - **Task Response (TR):** Does the essay fully address the topic? Are arguments well-developed?
-                    - **Coherence & Cohesion (CC):** Is the essay logically structured with clear paragraphing and linking words?
-                    - **Lexical Resource (LR):** How rich and precise is the vocabulary?
-                    - **Grammatical Range & Accuracy (GRA):** Are sentences grammatically correct with varied structures?
-
-                    4. **Return a JSON response** with:
-                    - `topic`: The extracted or generated topic/question.
-                    - `scores`: Band scores (0-9) for TR, CC, LR, and GRA.
-                    - `feedback`: Detailed feedback for each criterion.
-                    - `suggestions`: Actionable improvements.
-                    - `original_essay`: The exact input essay.
-                    - `word_count`: The number of words in the essay.
-                    """},
-                {"role": "user", "content": [
-                    {"type": "text", 
-                     "text": """"
-                        Please evaluate my IELTS writing task from image(s). The input contains:
-                        1. **Topic/Question** 
-                        2. **Essay Response**
-
-                        Your task:
-                        - Identify and extract the **topic/question** if present.
-                        - If no topic is found, **generate a relevant topic based on the essay**.
-                        - Evaluate the **essay content** based on the official IELTS writing band descriptors.
-                        - Provide structured **scores, feedback, and suggestions** for improvement.
-                     """},
-                    {"type": "image_url", 
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}},
-                ]}
-            ],
-            response_format=IELTSWritingEvaluation,
+        image = await ingest_data(data, digest, filename)
+        del data
+        transcripts = await read_transcripts([image])
+        essay_text = stitch_transcripts(transcripts)
+        screening, cache_key, messages = prepare_stream(essay_text)
+    except Exception as e:
+        yield ndjson_line(stream_error(e))
+        return
+    yield ndjson_line({"type": "transcript", "topic": transcript_topic(transcripts)})
+    async for line in stream_evaluation(
+        cache_key, ESSAY_MODEL, messages, evaluation_max_tokens(essay_text), essay_text, screening
+    ):
+        yield line
+
+
+@app.post("/api/py/evaluate-stream")
+async def evaluate_ielts_essay_stream(request: Request, essay_text: Optional[str] = Form(None),
+                                      file: Optional[UploadFile] = File(None)):
+    """Streaming variant of /api/py/evaluate that returns NDJSON events as fields are generated."""
+    if not essay_text and not file:
+        raise HTTPException(status_code=400, detail="Either text or an image file is required.")
+    admission_context(request)
+
+    if essay_text:
+        if not essay_text.strip():
+            raise HTTPException(status_code=400, detail="Essay text cannot be empty.")
+        screening, cache_key, messages = prepare_stream(essay_text)
+        events = stream_evaluation(
+            cache_key, ESSAY_MODEL, messages, evaluation_max_tokens(essay_text), essay_text, screening
         )
+    else:
+        # The upload is closed once this handler returns, so only its bytes are read here;
+        # optimizing, transcribing and scoring all happen inside the stream.
+        data, digest = await read_upload(file)
+        events = stream_image_evaluation(data, digest, file.filename)
+
+    return StreamingResponse(
+        events,
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        try:
-            # extracted_text = vision_response.choices[0].message.content
-            extracted_text = vision_response.choices[0].message.parsed
-            print(f"------------ IELTS Writing Evaluation Result from vision: {extracted_text.model_dump_json(indent=4)}",extracted_text)
-            # ✅ Ensure response is JSON by parsing it
-          
-        except json.JSONDecodeError as e:
-            print(f"❌ Error: Could not parse GPT response as JSON - {str(e)}")
-            return IELTSWritingEvaluation(error="Failed to extract topic and essay from image.")
-        
-        # if not essay_text:
-        #     raise HTTPException(status_code=400, detail={"error": "Essay text is missing from extracted content."})
-
-        # # ✅ Ensure essay is a single paragraph (remove extra line breaks)
-        # essay_text = " ".join(essay_text.split())
-    except Exception as e:
-        print(f"OpenAI vision API Error: {str(e)}")  # Log the error
-        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
-    execution_time = time.time() - start_time
-    print(f"Essay Processing Time: {execution_time:.2f} seconds")
-    # return process_ielts_essay(essay_text)
-    return extracted_text
+@app.post("/api/py/evaluate-batch")
+async def evaluate_batch(request: Request, file: UploadFile = File(...), concurrency: Optional[int] = None):
+    """
+    Evaluates a JSONL upload of essays concurrently and streams back one JSONL
+    record per item as it completes. Failed items are reported inline. Batch
+    items queue behind interactive requests for rate-limit budget.
+    """
+    admission_context(request, PRIORITY_BATCH)
+    contents = await read_batch_upload(file)
+    items = parse_batch_lines(contents.decode("utf-8", errors="replace").splitlines())
+    if not items:
+        raise HTTPException(status_code=400, detail="The batch file contains no essays.")
+
+    limit = batch_concurrency()
+    if concurrency:
+        limit = max(1, min(concurrency, limit))
+
+    async def results():
+        async for record in run_batch(items, process_ielts_essay, limit):
+            yield ndjson_line(record)
+
+    return StreamingResponse(results(), media_type=NDJSON_MEDIA_TYPE)
 
 
-@app.post("/api/py/evaluate-multi")
-async def evaluate_multiple_images(files: List[UploadFile] = File(...)):
-    """Processes multiple images together in a single request."""
+@app.post("/api/py/evaluate-multi", response_model=EvaluationResponse)
+async def evaluate_multiple_images(request: Request, files: List[UploadFile] = File(...)):
+    """Transcribes multiple page images in order and scores them as one essay."""
     start_time = time.time()
     if not files:
         raise HTTPException(status_code=400, detail="At least one image is required.")
+    admission_context(request)
+
+    essay_text = await transcribe_uploads(files)
+    ielts_result = await evaluation_response(essay_text)
+
+    execution_time = time.time() - start_time
+    logger.info("Essay Processing Time: %.2f seconds", execution_time)
+    return ielts_result
+
+
+async def run_job(kind: str, essay_text: Optional[str], images):
+    """Job handler: scores a stored essay, transcribing its page images first."""
+    if kind != "text":
+        essay_text = await transcribe_images(images)
+    return await process_ielts_essay(essay_text)
 
-    image_contents = []
-    for file in files:
-        contents = await file.read()
-        base64_image = base64.b64encode(contents).decode("utf-8")
-        image_contents.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}})
-
-    vision_response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", 
-                 "content": """You are an advanced IELTS examiner specializing in text extraction and evaluation.
-                Your task is to **strictly extract one single IELTS Writing Task 2 essay**, even if multiple essays are detected. 
-                Select the **most complete** essay only.
-
-                ### **Extraction Guidelines**
-                1. **Extract and Merge the Full Essay:**
-                - Retrieve the complete essay from all images, ensuring sentence continuity.
-                - If two essays exist, select only the one with **the highest word count and completeness**.
-                - Preserve paragraph structure and logical flow.
-                - If missing words appear due to image cutoffs, infer them where necessary.
-
-                2. **Identify the Topic:**
-                - Extract the topic/question if explicitly stated.
-                - If missing, generate a relevant topic based on the essay's content.
-
-                3. **Evaluate the Essay Based on Official IELTS Criteria:**
-                - **Task Response (TR):** Does the essay fully address the topic? Are arguments well-developed?
-                - **Coherence & Cohesion (CC):** Is the essay structured logically with clear paragraphing and linking words?
-                - **Lexical Resource (LR):** How varied and precise is the vocabulary?
-                - **Grammatical Range & Accuracy (GRA):** Are sentences grammatically correct with diverse structures?
-
-                4. **Provide Feedback and Suggestions:**
-                - Constructive feedback for improvement.
-                - Specific suggestions on enhancing coherence, vocabulary, and grammar.
-
-                5. **Strict JSON Output Format:** 
-                   - Ensure the response **is always valid JSON** and does not contain any extraneous characters.
-                   - Do not include markdown formatting like ```json.
-                   - Ensure correct nesting of objects and lists.
-
-                6. **Return a Valid JSON Response:** 
-                   Ensure the JSON response is strictly formatted as follows:
-                {
-                    "topic": "Extracted or generated topic",
-                    "word_count": 250,
-                    "score": {
-                        "task_response": 7.0,
-                        "coherence_and_cohesion": 6.5,
-                        "lexical_resource": 7.5,
-                        "grammatical_range_and_accuracy": 6.0,
-                        "overall_band": 7.0
-                    },
-                    "feedback": {
-                        "task_response": "Your response is strong but could benefit from more specific examples.",
-                        "coherence_and_cohesion": "Logical flow is clear, but transitions could be smoother.",
-                        "lexical_resource": "Good vocabulary variety, though some word choices feel repetitive.",
-                        "grammatical_range_and_accuracy": "Grammar is mostly accurate, but complex sentence structures need refining."
-                    },
-                    "suggestions": [
-                        "Use more varied linking words to improve cohesion.",
-                        "Provide deeper analysis to support key arguments.",
-                        "Work on sentence variety to enhance fluency."
-                    ],
-                    "original_essay": "The full reconstructed essay text."
-                }
-                
-
-                    """},
-            {"role": "user", "content": [
-                {"type": "text", "text": "Extract and evaluate the essays in these images based on IELTS criteria."},
-                *image_contents
-            ]}
-        ],
-        max_tokens=1000
+
+_job_queue = None
+
+
+def get_job_queue():
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = create_job_queue(run_job)
+    return _job_queue
+
+
+async def resume_jobs():
+    # Pick up jobs left queued by a previous run, without creating a store for apps that never use jobs
+    if os.path.exists(job_db_path()):
+        get_job_queue().start()
+
+
+app.router.on_startup.append(resume_jobs)
+
+
+async def warm_up_app(connections=1):
+    """
+    Does the first-request work ahead of time: renders the rubric prompts,
+    sizes the response schemas, opens the cache and builds the OpenAI client
+    with `connections` warm upstream connections. Returns seconds per step.
+    """
+    timings = {}
+    start = time.perf_counter()
+    await asyncio.to_thread(load_encodings, token_models())
+    timings["encodings"] = round(time.perf_counter() - start, 4)
+    start = time.perf_counter()
+    generate_system_prompt()
+    for key in get_criteria():
+        generate_criterion_prompt(key)
+    for response_format in (IELTSWritingEvaluation, FastTierEvaluation, CriterionEvaluation, TaskResponseEvaluation):
+        schema_tokens(response_format, ESSAY_MODEL)
+    get_cache()
+    timings["prompts"] = round(time.perf_counter() - start, 4)
+    start = time.perf_counter()
+    opened = await warm_up(connections)
+    timings["upstream"] = round(time.perf_counter() - start, 4)
+    logger.info("Warm-up finished: %s, %d upstream connection(s)", timings, opened)
+    return {"seconds": timings, "connections": opened}
+
+
+def warmup_connections() -> int:
+    """WARMUP_CONNECTIONS: connections opened at startup, and the most /api/py/warmup may open."""
+    return max(1, env_int("WARMUP_CONNECTIONS", 1))
+
+
+def token_models():
+    """Models whose prompts are counted: scoring, cascade fast tier and transcription."""
+    return sorted({ESSAY_MODEL, CascadeConfig.from_env(ESSAY_MODEL).fast_model, VISION_MODEL})
+
+
+async def preload_token_encodings():
+    # tiktoken may download its BPE files on first use; never on a request's event loop
+    preload_encodings(token_models())
+
+
+app.router.on_startup.append(preload_token_encodings)
+
+
+async def warm_up_on_startup():
+    # In the background, so the server accepts requests while connections open
+    if os.environ.get("WARMUP_ON_STARTUP", "0") != "0":
+        task = asyncio.ensure_future(warm_up_app(warmup_connections()))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+app.router.on_startup.append(warm_up_on_startup)
+
+
+def job_response(job):
+    # The stored result is already JSON, so it is spliced in rather than parsed and re-encoded
+    return raw_json_response(dumps_with({
+        "job_id": job["id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"],
+    }, result=job["result"]))
+
+
+@app.post("/api/py/jobs", status_code=202)
+async def submit_job(request: Request, essay_text: Optional[str] = Form(None),
+                     file: Optional[UploadFile] = File(None), files: Optional[List[UploadFile]] = File(None)):
+    """
+    Queues an evaluation and returns its job id at once. Accepts the same
+    inputs as /api/py/evaluate (`essay_text` or `file`) and
+    /api/py/evaluate-multi (`files`). Images are validated and optimized
+    before the job is stored, so bad uploads fail here rather than later.
+    """
+    uploads = ([file] if file else []) + (files or [])
+    if not essay_text and not uploads:
+        raise HTTPException(status_code=400, detail="Either text or image files are required.")
+    tenant = admission_context(request)
+    if essay_text:
+        if not essay_text.strip():
+            raise HTTPException(status_code=400, detail="Essay text cannot be empty.")
+        check_essay(essay_text, ESSAY_MODEL)
+        screen_essay(essay_text).raise_if_rejected()
+        job_id = await get_job_queue().submit("text", essay_text=essay_text, tenant=tenant)
+    else:
+        images = await asyncio.gather(*[ingest_upload(upload) for upload in uploads])
+        job_id = await get_job_queue().submit("images", images=images, tenant=tenant)
+    url = f"/api/py/jobs/{job_id}"
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job_id, "status": "queued", "url": url, "events_url": f"{url}/events"},
+        headers={"Location": url},
     )
 
-    try:
-        extracted_text = vision_response.choices[0].message.content
-        print("------------ extracted text from multiple: ",extracted_text)
-        # parsed_response = json.loads(extracted_text)
-        # Remove JSON-style formatting and return as a clean dictionary
-        parsed_response = json.loads(extracted_text.replace("```json", "").replace("```", "").strip())
-        
-        # print(f"------------ IELTS Writing Evaluation Result from multiple vision: {parsed_response}")
-        print(json.dumps(parsed_response, indent=4, ensure_ascii=False))
-
-        ielts_result = IELTSWritingEvaluation.model_validate(parsed_response)
-
-        # Step 4: Use `.model_dump_json()`
-        print(f"✔️ IELTS Writing Evaluation Result: {ielts_result.model_dump_json(indent=4)}")
-
-    
-        execution_time = time.time() - start_time
-        print(f"Essay Processing Time: {execution_time:.2f} seconds")
-        return ielts_result #parsed_response
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Failed to process the images.")
+
+@app.get("/api/py/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """Job status and, once finished, its result or error. `wait` (up to 60 s) long-polls for completion."""
+    queue = get_job_queue()
+    job = await queue.wait(job_id, min(max(wait, 0), 60)) if wait > 0 else await queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job_response(job)
+
+
+@app.get("/api/py/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """NDJSON stream of a job's status changes, ending with a `result` or `error` event."""
+    queue = get_job_queue()
+    job = await queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def events(job):
+        status = None
+        while True:
+            if job["status"] != status:
+                status = job["status"]
+                yield ndjson_line({"type": "status", "status": status})
+            if status in FINISHED:
+                break
+            job = await queue.wait(job_id, 1.0) or job
+        if status == "succeeded":
+            yield dumps_with({"type": "result"}, data=job["result"]) + b"\n"
+        else:
+            yield ndjson_line({"type": "error", "detail": job["error"]})
+
+    return StreamingResponse(
+        events(job), media_type=NDJSON_MEDIA_TYPE, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _check_admin_token(token: Optional[str]):
+    """Admin endpoints fail closed: they don't exist until ADMIN_TOKEN is configured."""
+    expected = os.environ.get("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+@app.get("/api/py/cache/stats")
+async def evaluation_cache_stats():
+    """Hit/miss counters and size of the evaluation cache, plus request coalescing counters."""
+    return {
+        **get_cache().stats(),
+        "single_flight": {"essays": essay_flights.stats(), "transcriptions": transcription_flights.stats()},
+    }
+
+
+@app.get("/api/py/cascade/stats")
+async def evaluation_cascade_stats():
+    """Which tier answered cascade evaluations, escalation reasons and tier agreement."""
+    return cascade_stats.stats()
+
+
+@app.delete("/api/py/cache")
+async def invalidate_evaluation_cache(key: Optional[str] = None, prefix: Optional[str] = None,
+                                      x_admin_token: Optional[str] = Header(None)):
+    """Invalidates one cache key, every key with a prefix (e.g. `text:`), or the whole cache."""
+    _check_admin_token(x_admin_token)
+    removed = await get_cache().invalidate(key=key, prefix=prefix)
+    return {"removed": removed}
+
+
+@app.post("/api/py/warmup")
+async def warmup(connections: Optional[int] = None, x_admin_token: Optional[str] = Header(None)):
+    """
+    Primes a fresh instance: prompts, response schemas, the OpenAI client and
+    `connections` upstream connections (at most WARMUP_CONNECTIONS). Point a
+    platform warm-up or cron ping here; it needs the admin token.
+    """
+    _check_admin_token(x_admin_token)
+    limit = warmup_connections()
+    return await warm_up_app(max(1, min(connections or limit, limit)))
+
+
+@app.get("/api/py/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus metrics: per-stage and upstream latency histograms and token counters."""
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,283 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+
+from .env import env_float, env_int
+from .metrics import admission_queue_depth, admission_rejected_total, observe_stage
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch"}
+
+WINDOW = 60.0
+
+_request_context = ContextVar("admission_request", default=("anonymous", PRIORITY_INTERACTIVE))
+
+
+class AdmissionRejectedError(Exception):
+    """Raised instead of queueing when the wait for rate-limit budget would exceed the latency SLO."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def set_request_context(tenant, priority=PRIORITY_INTERACTIVE):
+    """Tags upstream calls made by the current task (and tasks it starts) with a tenant and priority."""
+    _request_context.set((tenant or "anonymous", priority))
+
+
+def get_request_context():
+    return _request_context.get()
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset(value):
+    """Parses rate-limit reset durations such as `6ms`, `1.5s` or `1m30s` into seconds."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_int(headers, name):
+    try:
+        return int(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+class RateBudget:
+    """
+    Requests- and tokens-per-minute budget for one model.
+
+    Limits come from RPM/TPM settings or, when unset, from the provider's
+    `x-ratelimit-limit-*` headers. Admitted calls are counted in a sliding
+    one-minute window using their estimated tokens, and the provider's
+    `x-ratelimit-remaining-*` / `x-ratelimit-reset-*` headers pause
+    admission when it reports the budget as spent.
+    """
+
+    def __init__(self, rpm=None, tpm=None, headroom=0.9):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.headroom = headroom
+        self._configured = (rpm is not None, tpm is not None)
+        self._window = deque()
+        self._window_tokens = 0
+        self._paused_until = 0.0
+
+    def _expire(self, now):
+        while self._window and self._window[0][0] <= now - WINDOW:
+            self._window_tokens -= self._window.popleft()[1]
+
+    def delay(self, tokens, now=None):
+        """Seconds until a call of `tokens` fits the budget (0 when it fits now)."""
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        wait = max(0.0, self._paused_until - now)
+        if self.rpm:
+            capacity = max(1, int(self.rpm * self.headroom))
+            excess = len(self._window) + 1 - capacity
+            if excess > 0:
+                wait = max(wait, self._window[excess - 1][0] + WINDOW - now)
+        if self.tpm and self._window_tokens + tokens > self.tpm * self.headroom:
+            needed = self._window_tokens + tokens - self.tpm * self.headroom
+            for started, used in self._window:
+                needed -= used
+                if needed <= 0:
+                    wait = max(wait, started + WINDOW - now)
+                    break
+            else:
+                # Bigger than the whole budget: let it through once the window is empty
+                wait = max(wait, self._window[-1][0] + WINDOW - now if self._window else 0.0)
+        return wait
+
+    def consume(self, tokens, now=None):
+        now = time.monotonic() if now is None else now
+        self._window.append((now, tokens))
+        self._window_tokens += tokens
+
+    def projected_wait(self, requests, tokens):
+        """
+        Rough seconds until `requests` calls totalling `tokens` are admitted:
+        the wait for the window to free up, or the steady-state rate beyond it.
+        """
+        first = self.delay(tokens / max(1, requests))
+        rates = [0.0]
+        if self.rpm:
+            excess = len(self._window) + requests - self.rpm * self.headroom
+            rates.append(excess / (self.rpm / WINDOW))
+        if self.tpm:
+            excess = self._window_tokens + tokens - self.tpm * self.headroom
+            rates.append(excess / (self.tpm / WINDOW))
+        return max(first, max(rates) + max(0.0, self._paused_until - time.monotonic()))
+
+    def observe_headers(self, headers, status_code=200):
+        """Updates limits and pauses from a provider response's rate-limit headers."""
+        limit_requests = _header_int(headers, "x-ratelimit-limit-requests")
+        limit_tokens = _header_int(headers, "x-ratelimit-limit-tokens")
+        if limit_requests and not self._configured[0]:
+            self.rpm = limit_requests
+        if limit_tokens and not self._configured[1]:
+            self.tpm = limit_tokens
+        now = time.monotonic()
+        for kind in ("requests", "tokens"):
+            remaining = _header_int(headers, f"x-ratelimit-remaining-{kind}")
+            reset = parse_reset(headers.get(f"x-ratelimit-reset-{kind}"))
+            if reset and (status_code == 429 or remaining == 0):
+                self._paused_until = max(self._paused_until, now + reset)
+
+
+class _Waiter:
+    __slots__ = ("future", "tokens", "enqueued_at", "max_wait")
+
+    def __init__(self, future, tokens, max_wait):
+        self.future = future
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.max_wait = max_wait
+
+
+class AdmissionController:
+    """
+    Gates upstream calls for one model on its RateBudget.
+
+    Calls that can't go immediately wait in per-priority queues, served
+    strictly by priority (interactive before batch) and round-robin across
+    tenants within a priority, so one tenant's burst can't starve others.
+    A call whose projected wait exceeds its priority's SLO is rejected up
+    front, and waiters that exceed it in the queue are rejected too, both
+    with AdmissionRejectedError carrying a retry hint.
+    """
+
+    def __init__(self, name, budget: RateBudget, max_wait):
+        self.name = name
+        self.budget = budget
+        # priority -> latency SLO in seconds
+        self.max_wait = max_wait
+        # priority -> tenant -> deque of waiters
+        self._queues = {priority: OrderedDict() for priority in max_wait}
+        self._dispatcher = None
+
+    def queued(self, priority=None):
+        priorities = [priority] if priority is not None else list(self._queues)
+        return sum(len(q) for p in priorities for q in self._queues[p].values())
+
+    def _ahead(self, priority):
+        requests = tokens = 0
+        for p, tenants in self._queues.items():
+            if p <= priority:
+                for queue in tenants.values():
+                    requests += len(queue)
+                    tokens += sum(w.tokens for w in queue)
+        return requests, tokens
+
+    def _reject(self, priority, retry_after):
+        admission_rejected_total.inc(model=self.name, priority=PRIORITY_NAMES.get(priority, priority))
+        return AdmissionRejectedError(
+            "The service is at capacity, please retry shortly.", max(1.0, retry_after)
+        )
+
+    async def admit(self, tokens, tenant="anonymous", priority=PRIORITY_INTERACTIVE):
+        """Waits until a call of `tokens` estimated tokens may be sent upstream."""
+        start = time.monotonic()
+        if not self.queued() and self.budget.delay(tokens, start) == 0:
+            self.budget.consume(tokens, start)
+            return
+
+        max_wait = self.max_wait.get(priority, self.max_wait[PRIORITY_BATCH])
+        requests_ahead, tokens_ahead = self._ahead(priority)
+        projected = self.budget.projected_wait(requests_ahead + 1, tokens_ahead + tokens)
+        if projected > max_wait:
+            raise self._reject(priority, projected)
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tokens, max_wait)
+        self._queues[priority].setdefault(tenant, deque()).append(waiter)
+        admission_queue_depth.set(self.queued(), model=self.name)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self._remove(priority, tenant, waiter)
+            raise
+        finally:
+            observe_stage("admission_queue", time.monotonic() - start)
+
+    def _remove(self, priority, tenant, waiter):
+        queue = self._queues[priority].get(tenant)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[priority][tenant]
+        admission_queue_depth.set(self.queued(), model=self.name)
+
+    def _next(self):
+        """Pops the next waiter: highest priority first, rotating through tenants."""
+        for priority in sorted(self._queues):
+            tenants = self._queues[priority]
+            while tenants:
+                tenant, queue = next(iter(tenants.items()))
+                waiter = queue[0]
+                if waiter.future.done():
+                    queue.popleft()
+                elif time.monotonic() - waiter.enqueued_at > waiter.max_wait:
+                    queue.popleft()
+                    waiter.future.set_exception(self._reject(priority, waiter.max_wait))
+                else:
+                    return priority, tenant, waiter
+                if not queue:
+                    del tenants[tenant]
+        return None
+
+    async def _dispatch(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                admission_queue_depth.set(0, model=self.name)
+                return
+            priority, tenant, waiter = entry
+            delay = self.budget.delay(waiter.tokens)
+            if delay > 0:
+                # Wake up in time to reject waiters that pass their SLO
+                await asyncio.sleep(min(delay, 0.5))
+                continue
+            tenants = self._queues[priority]
+            tenants[tenant].popleft()
+            # Rotate: this tenant goes to the back of the line
+            queue = tenants.pop(tenant)
+            if queue:
+                tenants[tenant] = queue
+            self.budget.consume(waiter.tokens)
+            waiter.future.set_result(None)
+            admission_queue_depth.set(self.queued(), model=self.name)
+
+
+DEFAULT_MAX_WAIT = 15.0
+DEFAULT_BATCH_MAX_WAIT = 300.0
+
+_controllers = {}
+
+
+def get_admission(model: str) -> AdmissionController:
+    """Returns the admission controller for `model`, configured from the environment on first use."""
+    controller = _controllers.get(model)
+    if controller is None:
+        budget = RateBudget(
+            rpm=env_int("OPENAI_RPM_LIMIT", None),
+            tpm=env_int("OPENAI_TPM_LIMIT", None),
+            headroom=env_float("OPENAI_RATE_HEADROOM", 0.9),
+        )
+        controller = _controllers[model] = AdmissionController(model, budget, {
+            PRIORITY_INTERACTIVE: env_float("ADMISSION_MAX_WAIT", DEFAULT_MAX_WAIT),
+            PRIORITY_BATCH: env_float("ADMISSION_BATCH_MAX_WAIT", DEFAULT_BATCH_MAX_WAIT),
+        })
+    return controller
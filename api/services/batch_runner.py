@@ -0,0 +1,218 @@
+"""
+Concurrent batch evaluation over JSONL input.
+
+Each input line is a JSON object with an id (`request_id` or `id`) and the
+essay (`essay_text`, `essay` or `body`; an optional `title` is prepended as
+the topic). Each output line is `{"id", "status": "ok", "result"}` (with
+the pre-screen's `warnings`, if any) or `{"id", "status": "error", "error"}`
+(with a `reason` when the pre-screen rejected the essay), in completion
+order. The whole batch is pre-screened up front, so rejected essays never
+take a worker slot.
+
+CLI usage:
+    python -m api.services.batch_runner essays.jsonl -o results.jsonl \\
+        --concurrency 8 --checkpoint essays.done
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from .admission import PRIORITY_BATCH, set_request_context
+from .env import env_int
+from .prescreen import screen_essays
+from .uploads import UploadTooLargeError, read_limited
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+ID_KEYS = ("request_id", "id")
+TEXT_KEYS = ("essay_text", "essay", "body")
+
+
+class BatchTooLargeError(UploadTooLargeError):
+    """Raised when a batch upload exceeds BATCH_MAX_UPLOAD_BYTES."""
+
+
+def batch_concurrency() -> int:
+    return max(1, env_int("BATCH_CONCURRENCY", DEFAULT_CONCURRENCY))
+
+
+def max_upload_bytes() -> int:
+    return env_int("BATCH_MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES)
+
+
+async def read_batch_upload(file, limit=None) -> bytes:
+    """Reads a JSONL UploadFile, raising BatchTooLargeError as soon as it exceeds `limit`."""
+    return await read_limited(file, limit or max_upload_bytes(), BatchTooLargeError)
+
+
+def parse_batch_line(line: str, line_number: int):
+    """
+    Parses one JSONL line into `{"id", "essay_text"}`, or `{"id", "error"}`
+    when the line is unusable. Returns None for blank lines.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    item_id = f"line-{line_number}"
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"id": item_id, "error": f"Invalid JSON: {e}"}
+    if not isinstance(record, dict):
+        return {"id": item_id, "error": "Each line must be a JSON object."}
+
+    item_id = str(next((record[k] for k in ID_KEYS if record.get(k) is not None), item_id))
+    text = next((record[k] for k in TEXT_KEYS if isinstance(record.get(k), str)), None)
+    if not text or not text.strip():
+        return {"id": item_id, "error": f"Missing essay text (one of {', '.join(TEXT_KEYS)})."}
+    title = record.get("title")
+    if isinstance(title, str) and title.strip():
+        text = f"{title.strip()}\n\n{text}"
+    return {"id": item_id, "essay_text": text}
+
+
+def parse_batch_lines(lines):
+    items = []
+    for number, line in enumerate(lines, start=1):
+        item = parse_batch_line(line, number)
+        if item is not None:
+            items.append(item)
+    return items
+
+
+def error_detail(exc: Exception) -> str:
+    # HTTPException carries its message in `detail`
+    detail = getattr(exc, "detail", None)
+    return str(detail) if detail else (str(exc) or type(exc).__name__)
+
+
+def prescreen_items(items):
+    """
+    Screens the essays of parsed items in one pass. Rejected items become
+    error items (with a `reason`); the others get their `screening`.
+    """
+    texts = [item for item in items if "error" not in item]
+    for item, screening in zip(texts, screen_essays([item["essay_text"] for item in texts])):
+        if screening.rejection is not None:
+            reason, message = screening.rejection
+            item.update(error=message, reason=reason)
+        else:
+            item["screening"] = screening
+    return items
+
+
+async def evaluate_batch_item(item, evaluate):
+    """Evaluates one parsed item; failures become error records instead of raising."""
+    if "error" in item:
+        record = {"id": item["id"], "status": "error", "error": item["error"]}
+        if "reason" in item:
+            record["reason"] = item["reason"]
+        return record
+    screening = item.get("screening")
+    try:
+        result = await evaluate(item["essay_text"], screening)
+    except Exception as e:
+        return {"id": item["id"], "status": "error", "error": error_detail(e)}
+    record = {"id": item["id"], "status": "ok", "result": result.model_dump()}
+    if screening is not None and screening.warnings:
+        record["warnings"] = screening.to_dict()["warnings"]
+    return record
+
+
+async def run_batch(items, evaluate, concurrency=None):
+    """
+    Pre-screens `items`, then evaluates them with a pool of `concurrency`
+    workers calling `evaluate(essay_text, screening)`, yielding result
+    records as they complete. Closing the generator cancels the outstanding work.
+    """
+    concurrency = concurrency or batch_concurrency()
+    # Off the event loop: a large upload takes a noticeable fraction of a second to screen
+    items = await asyncio.to_thread(prescreen_items, items)
+    pending = asyncio.Queue()
+    for item in items:
+        pending.put_nowait(item)
+    finished = asyncio.Queue()
+
+    async def worker():
+        while True:
+            try:
+                item = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            finished.put_nowait(await evaluate_batch_item(item, evaluate))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(items)))]
+    try:
+        for _ in range(len(items)):
+            yield await finished.get()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def _read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+async def run_batch_file(input_path, output_path=None, concurrency=None, checkpoint_path=None):
+    """
+    Runs a JSONL file through `process_ielts_essay`. Ids listed in the
+    checkpoint file are skipped, and every successful id is appended to it,
+    so an interrupted run can be resumed with the same arguments.
+    """
+    from ..index import process_ielts_essay
+
+    set_request_context("batch-cli", PRIORITY_BATCH)
+
+    if input_path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(input_path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+    done = _read_checkpoint(checkpoint_path)
+    items = [item for item in parse_batch_lines(lines) if item["id"] not in done]
+    if done:
+        print(f"Resuming batch: skipping {len(done)} completed items", file=sys.stderr)
+
+    out = open(output_path, "a", encoding="utf-8") if output_path else sys.stdout
+    checkpoint = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
+    counts = {"ok": 0, "error": 0}
+    try:
+        async for record in run_batch(items, process_ielts_essay, concurrency):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            counts[record["status"]] += 1
+            if checkpoint is not None and record["status"] == "ok":
+                checkpoint.write(record["id"] + "\n")
+                checkpoint.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if checkpoint is not None:
+            checkpoint.close()
+    print(f"Batch finished: {counts['ok']} ok, {counts['error']} failed", file=sys.stderr)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a JSONL file of IELTS essays.")
+    parser.add_argument("input", help="JSONL input file, or - for stdin")
+    parser.add_argument("-o", "--output", help="JSONL output file (appended to); defaults to stdout")
+    parser.add_argument("-c", "--concurrency", type=int, default=None,
+                        help=f"Parallel evaluations (default: BATCH_CONCURRENCY or {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--checkpoint", help="File of completed ids used to resume an interrupted run")
+    args = parser.parse_args(argv)
+    counts = asyncio.run(run_batch_file(args.input, args.output, args.concurrency, args.checkpoint))
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
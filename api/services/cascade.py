@@ -0,0 +1,111 @@
+import math
+import os
+
+from .env import env_float
+from .metrics import cascade_agreement_total, cascade_answers_total, cascade_escalations_total
+from .rubric_evaluator import overall_band
+
+DEFAULT_FAST_MODEL = "gpt-4o-mini"
+DEFAULT_BOUNDARY_MARGIN = 0.125
+DEFAULT_MAX_SPREAD = 2.0
+DEFAULT_MIN_CONFIDENCE = 0.7
+
+RULES = ("validation", "boundary", "inconsistent", "low_confidence")
+
+
+class CascadeConfig:
+    """Routing settings, read from the environment (CASCADE_*)."""
+
+    def __init__(self, fast_model, strong_model, rules=RULES, boundary_margin=DEFAULT_BOUNDARY_MARGIN,
+                 max_spread=DEFAULT_MAX_SPREAD, min_confidence=DEFAULT_MIN_CONFIDENCE):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.rules = tuple(rules)
+        self.boundary_margin = boundary_margin
+        self.max_spread = max_spread
+        self.min_confidence = min_confidence
+
+    @classmethod
+    def from_env(cls, strong_model):
+        rules = os.environ.get("CASCADE_RULES")
+        return cls(
+            fast_model=os.environ.get("CASCADE_FAST_MODEL", DEFAULT_FAST_MODEL),
+            strong_model=os.environ.get("CASCADE_STRONG_MODEL", strong_model),
+            rules=[r.strip() for r in rules.split(",") if r.strip() in RULES] if rules else RULES,
+            boundary_margin=env_float("CASCADE_BOUNDARY_MARGIN", DEFAULT_BOUNDARY_MARGIN),
+            max_spread=env_float("CASCADE_MAX_SPREAD", DEFAULT_MAX_SPREAD),
+            min_confidence=env_float("CASCADE_MIN_CONFIDENCE", DEFAULT_MIN_CONFIDENCE),
+        )
+
+
+def escalation_reasons(scores, reported_overall, confidence, config: CascadeConfig):
+    """
+    Returns the escalation rules that fire for a fast-tier result (empty when
+    it can be accepted as is). Scores outside 0-9 fail validation outright.
+
+    - boundary: a criterion off the half-band scale, or a criterion mean
+      within `boundary_margin` of a rounding threshold (x.25 / x.75), where
+      a small scoring difference flips the overall band.
+    - inconsistent: criteria more than `max_spread` bands apart, or a
+      reported overall band that doesn't match the criteria.
+    - low_confidence: self-reported confidence below `min_confidence`.
+    """
+    values = list(scores.values())
+    if any(not 0 <= v <= 9 for v in values):
+        return ["validation"]
+    reasons = []
+    if "boundary" in config.rules:
+        average = sum(values) / len(values)
+        fraction = average - math.floor(average)
+        off_scale = any(v * 2 != int(v * 2) for v in values)
+        near_threshold = min(abs(fraction - 0.25), abs(fraction - 0.75)) < config.boundary_margin
+        if off_scale or near_threshold:
+            reasons.append("boundary")
+    if "inconsistent" in config.rules:
+        if max(values) - min(values) > config.max_spread or abs(reported_overall - overall_band(values)) > 0.5:
+            reasons.append("inconsistent")
+    if "low_confidence" in config.rules and confidence is not None and confidence < config.min_confidence:
+        reasons.append("low_confidence")
+    return reasons
+
+
+class CascadeStats:
+    """Counts which tier answered, why essays escalated, and how often the tiers agreed."""
+
+    def __init__(self):
+        self.counters = {"evaluations": 0, "fast": 0, "strong": 0}
+        self.escalations = {rule: 0 for rule in RULES}
+        self.agreement = {"exact": 0, "within_half_band": 0, "disagree": 0}
+        self._abs_diff = 0.0
+
+    def record_answer(self, tier, model):
+        self.counters["evaluations"] += 1
+        self.counters[tier] += 1
+        cascade_answers_total.inc(tier=tier, model=model)
+
+    def record_escalation(self, reasons):
+        for reason in reasons:
+            self.escalations[reason] += 1
+            cascade_escalations_total.inc(reason=reason)
+
+    def record_comparison(self, fast_overall, strong_overall):
+        """Compares the overall bands both tiers gave the same essay."""
+        diff = abs(fast_overall - strong_overall)
+        outcome = "exact" if diff == 0 else "within_half_band" if diff <= 0.5 else "disagree"
+        self.agreement[outcome] += 1
+        self._abs_diff += diff
+        cascade_agreement_total.inc(outcome=outcome)
+
+    def stats(self):
+        evaluations = self.counters["evaluations"]
+        compared = sum(self.agreement.values())
+        return {
+            **self.counters,
+            "escalation_rate": round(self.counters["strong"] / evaluations, 4) if evaluations else 0.0,
+            "escalations": dict(self.escalations),
+            "agreement": dict(self.agreement),
+            "agreement_rate": round(
+                (self.agreement["exact"] + self.agreement["within_half_band"]) / compared, 4
+            ) if compared else None,
+            "mean_abs_band_diff": round(self._abs_diff / compared, 4) if compared else None,
+        }
@@ -0,0 +1,26 @@
+"""
+Numeric settings read from the environment.
+
+Unset, empty or malformed values fall back to the default, so a typo in a
+deployment's environment degrades to the documented default instead of
+failing the request that first reads it.
+"""
+import os
+
+
+def env_number(name, default, kind=float):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return kind(value)
+    except ValueError:
+        return default
+
+
+def env_int(name, default):
+    return env_number(name, default, int)
+
+
+def env_float(name, default):
+    return env_number(name, default, float)
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from .env import env_int
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_STALE_TTL = 24 * 3600
+
+
+def normalize_essay_text(text: str) -> str:
+    """
+    Normalizes an essay for hashing: NFC, collapsed spaces within lines and
+    collapsed blank-line runs, so whitespace-only edits map to the same key
+    while paragraph breaks are preserved.
+    """
+    text = unicodedata.normalize("NFC", text)
+    lines = []
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def make_cache_key(kind: str, content, model: str, version: str) -> str:
+    """
+    Content-addressed key for an evaluation. `content` is essay text
+    (normalized first) or raw image bytes.
+    """
+    if isinstance(content, str):
+        content = normalize_essay_text(content).encode("utf-8")
+    return make_digest_key(kind, hashlib.sha256(content).hexdigest(), model, version)
+
+
+def make_digest_key(kind: str, digest: str, model: str, version: str) -> str:
+    """Cache key from an already computed sha256 hex digest of the content."""
+    return f"{kind}:{model}:{version}:{digest}"
+
+
+class _SQLiteTier:
+    """On-disk tier shared by every worker pointing at the same file."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS evaluation_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM evaluation_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        return row[0], row[1]
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO evaluation_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._conn.commit()
+
+    def delete(self, key=None, prefix=None):
+        with self._lock:
+            if key is not None:
+                cursor = self._conn.execute("DELETE FROM evaluation_cache WHERE key = ?", (key,))
+            elif prefix is not None:
+                cursor = self._conn.execute(
+                    "DELETE FROM evaluation_cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+                )
+            else:
+                cursor = self._conn.execute("DELETE FROM evaluation_cache")
+            self._conn.commit()
+            return cursor.rowcount
+
+    def purge_expired(self, now):
+        with self._lock:
+            self._conn.execute("DELETE FROM evaluation_cache WHERE expires_at <= ?", (now,))
+            self._conn.commit()
+
+
+class EvaluationCache:
+    """
+    Two-tier cache for serialized evaluation results.
+
+    The in-process tier is an LRU bounded by entry count and total bytes;
+    entries expire after `ttl` seconds. When `db_path` is set, misses fall
+    through to a SQLite file and hits are promoted back into memory.
+
+    Expired entries are kept for a further `stale_ttl` seconds so that
+    `get(key, allow_stale=True)` can still answer while upstream is down.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 ttl=DEFAULT_TTL, db_path=None, stale_ttl=DEFAULT_STALE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk = _SQLiteTier(db_path) if db_path else None
+        self._sets_since_purge = 0
+        self.counters = {
+            "memory_hits": 0, "disk_hits": 0, "stale_hits": 0, "misses": 0, "stores": 0, "evictions": 0,
+        }
+
+    def _remember(self, key, value, expires_at):
+        size = len(value)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[1])
+        self._entries[key] = (expires_at, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.counters["evictions"] += 1
+
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+        return entry is not None
+
+    async def get(self, key, allow_stale=False):
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry[1]
+            if entry[0] + self.stale_ttl <= now:
+                self._forget(key)
+            elif allow_stale:
+                self.counters["stale_hits"] += 1
+                return entry[1]
+
+        if self._disk is not None:
+            cutoff = now - self.stale_ttl if allow_stale else now
+            row = await asyncio.to_thread(self._disk.get, key, cutoff)
+            if row is not None:
+                self._remember(key, row[0], row[1])
+                self.counters["stale_hits" if row[1] <= now else "disk_hits"] += 1
+                return row[0]
+
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, key, value: str):
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        self.counters["stores"] += 1
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value, expires_at)
+            self._sets_since_purge += 1
+            if self._sets_since_purge >= 256:
+                self._sets_since_purge = 0
+                await asyncio.to_thread(self._disk.purge_expired, time.time() - self.stale_ttl)
+
+    async def invalidate(self, key=None, prefix=None) -> int:
+        """
+        Drops one key, every key starting with `prefix`, or everything.
+        Returns the number of entries removed (memory and disk combined).
+        """
+        if key is not None:
+            removed = int(self._forget(key))
+        elif prefix is not None:
+            matching = [k for k in self._entries if k.startswith(prefix)]
+            for k in matching:
+                self._forget(k)
+            removed = len(matching)
+        else:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        if self._disk is not None:
+            removed += await asyncio.to_thread(self._disk.delete, key, prefix)
+        return removed
+
+    def stats(self):
+        lookups = sum(self.counters[name] for name in ("memory_hits", "disk_hits", "stale_hits", "misses"))
+        hits = lookups - self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "disk_enabled": self._disk is not None,
+        }
+
+
+_cache = None
+
+
+def get_cache() -> EvaluationCache:
+    """
+    Returns the process-wide evaluation cache, configured from the environment
+    on first use.
+    """
+    global _cache
+    if _cache is None:
+        _cache = EvaluationCache(
+            max_entries=env_int("EVAL_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES),
+            max_bytes=env_int("EVAL_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES),
+            ttl=env_int("EVAL_CACHE_TTL", DEFAULT_TTL),
+            db_path=os.environ.get("EVAL_CACHE_PATH") or None,
+            stale_ttl=env_int("EVAL_CACHE_STALE_TTL", DEFAULT_STALE_TTL),
+        )
+    return _cache
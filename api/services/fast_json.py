@@ -0,0 +1,83 @@
+"""
+JSON on the hot path.
+
+Evaluations are validated once, from the raw JSON, with
+`model_validate_json`, and are written out without a second pass through
+`json` / FastAPI's `jsonable_encoder`. Payloads that are already
+serialized (cached evaluations, job results) are passed through as is.
+orjson is used when installed, the standard library otherwise.
+"""
+import json
+
+import pydantic_core
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+def dumps(value) -> bytes:
+    """Compact UTF-8 JSON for plain Python values."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dumps_with(value: dict, **serialized) -> bytes:
+    """
+    Encodes `value` with extra keys whose values are already JSON text,
+    spliced in without parsing them again (None becomes null).
+    """
+    body = dumps(value)[:-1]
+    for key, raw in serialized.items():
+        if raw is None:
+            raw = b"null"
+        elif isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        body += b"%s%s:%s" % (b"" if body == b"{" else b",", dumps(key), raw)
+    return body + b"}"
+
+
+def extend_json(raw, **values) -> bytes:
+    """
+    Adds keys with plain Python values to an already serialized JSON object
+    (str or bytes), without parsing it.
+    """
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    body = raw.rstrip()[:-1].rstrip()
+    for key, value in values.items():
+        body += b"%s%s:%s" % (b"" if body.endswith(b"{") else b",", dumps(key), dumps(value))
+    return body + b"}"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered compactly, with orjson when available."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def model_response(model, status_code=200, headers=None, **extra) -> Response:
+    """
+    Serializes a validated pydantic model straight to the response body,
+    with any `extra` keys added to it. Returning a Response skips FastAPI's
+    re-validation against `response_model`.
+    """
+    body = pydantic_core.to_json(model)
+    if extra:
+        body = extend_json(body, **extra)
+    return Response(body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+def raw_json_response(payload, status_code=200, headers=None) -> Response:
+    """Sends already serialized JSON (e.g. a cached evaluation) as is."""
+    return Response(payload, status_code=status_code, headers=headers, media_type="application/json")
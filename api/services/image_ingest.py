@@ -0,0 +1,190 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import time
+
+from .env import env_int
+from .metrics import observe_stage, timed_stage
+from .uploads import UploadTooLargeError, read_limited
+
+DEFAULT_MAX_UPLOAD_BYTES = 15 * 1024 * 1024
+DEFAULT_MAX_SIDE = 2048
+# Vision models rescale high-detail images so the short side is at most 768px;
+# anything larger is sent and billed for nothing.
+DEFAULT_MAX_SHORT_SIDE = 768
+DEFAULT_JPEG_QUALITY = 80
+
+# MIME types the vision API accepts as-is
+SUPPORTED_MIME_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+
+_pil_checked = False
+_pil = None
+
+
+class ImageTooLargeError(UploadTooLargeError):
+    """Raised when an upload exceeds IMAGE_MAX_UPLOAD_BYTES."""
+
+
+class UnsupportedImageError(Exception):
+    """Raised when an upload is not an image format we can send upstream."""
+
+
+def max_upload_bytes() -> int:
+    return env_int("IMAGE_MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES)
+
+
+def _pillow():
+    """Returns (Image, ImageOps) when Pillow is installed, else None."""
+    global _pil_checked, _pil
+    if not _pil_checked:
+        try:
+            from PIL import Image, ImageOps
+            _pil = (Image, ImageOps)
+        except ImportError:
+            _pil = None
+        _pil_checked = True
+    return _pil
+
+
+def detect_mime_type(header: bytes):
+    """Detects the image format from its leading bytes; None if unknown."""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[4:8] == b"ftyp" and header[8:12] in (b"heic", b"heix", b"mif1", b"msf1", b"heim", b"heis"):
+        return "image/heic"
+    return None
+
+
+class IngestedImage:
+    """An upload ready for the vision API, plus the hash of the original bytes."""
+
+    __slots__ = ("data", "mime_type", "digest", "original_size", "width", "height")
+
+    def __init__(self, data, mime_type, digest, original_size, width=None, height=None):
+        self.data = data
+        self.mime_type = mime_type
+        self.digest = digest
+        self.original_size = original_size
+        self.width = width
+        self.height = height
+
+    def data_url(self) -> str:
+        # One encoded copy plus the ASCII decode; no intermediate string joins.
+        with timed_stage("base64_encode"):
+            encoded = base64.b64encode(self.data)
+            return f"data:{self.mime_type};base64,{encoded.decode('ascii')}"
+
+
+async def read_upload(file, limit=None):
+    """
+    Reads an UploadFile in chunks, failing as soon as it exceeds `limit`.
+    Returns (bytes, sha256 hex digest).
+    """
+    start = time.perf_counter()
+    digest = hashlib.sha256()
+    data = await read_limited(file, limit or max_upload_bytes(), ImageTooLargeError, digest)
+    observe_stage("upload_read", time.perf_counter() - start)
+    return data, digest.hexdigest()
+
+
+def _target_size(width, height, max_side, max_short_side):
+    scale = min(1.0, max_side / max(width, height), max_short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _crop_margins(image, ImageOps):
+    """Crops plain page margins around the written text (grayscale images)."""
+    mask = ImageOps.autocontrast(image).point(lambda p: 255 if p < 160 else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return image
+    pad = max(8, min(image.size) // 50)
+    left, top, right, bottom = bbox
+    bbox = (max(0, left - pad), max(0, top - pad), min(image.width, right + pad), min(image.height, bottom + pad))
+    # Don't crop to a sliver when the page is mostly noise or a single mark
+    if (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) < 0.2 * image.width * image.height:
+        return image
+    return image.crop(bbox)
+
+
+def optimize_image(data: bytes, mime_type):
+    """
+    Downscales and recompresses an image to what the vision model can use:
+    EXIF orientation applied, optionally grayscale with margins cropped, fit
+    within IMAGE_MAX_SIDE / IMAGE_MAX_SHORT_SIDE and saved as JPEG.
+
+    Returns (data, mime_type, width, height). Without Pillow, supported formats
+    pass through unchanged.
+    """
+    pil = _pillow()
+    if pil is None:
+        if mime_type not in SUPPORTED_MIME_TYPES:
+            raise UnsupportedImageError(f"Unsupported image format: {mime_type or 'unknown'}.")
+        return data, mime_type, None, None
+    Image, ImageOps = pil
+
+    max_side = env_int("IMAGE_MAX_SIDE", DEFAULT_MAX_SIDE)
+    max_short_side = env_int("IMAGE_MAX_SHORT_SIDE", DEFAULT_MAX_SHORT_SIDE)
+    grayscale = os.environ.get("IMAGE_GRAYSCALE", "1") != "0"
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format == "JPEG":
+            # Let the JPEG decoder downscale by 1/2..1/8 while decoding, so a
+            # 12 MP photo is never fully materialized in memory.
+            image.draft("L" if grayscale else "RGB", _target_size(image.width, image.height, max_side, max_short_side))
+        image.load()
+    except Exception:
+        raise UnsupportedImageError(f"Unsupported or corrupt image: {mime_type or 'unknown format'}.")
+
+    image = ImageOps.exif_transpose(image)
+    original_dims = image.size
+    if grayscale:
+        image = image.convert("L")
+        if os.environ.get("IMAGE_CROP", "1") != "0":
+            image = _crop_margins(image, ImageOps)
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    size = _target_size(image.width, image.height, max_side, max_short_side)
+    if size != image.size:
+        image = image.resize(size, Image.LANCZOS)
+
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=env_int("IMAGE_JPEG_QUALITY", DEFAULT_JPEG_QUALITY), optimize=True)
+    optimized = out.getvalue()
+    if image.size == original_dims and mime_type in SUPPORTED_MIME_TYPES and len(optimized) >= len(data):
+        # Already small; keep the original encoding
+        return data, mime_type, image.width, image.height
+    return optimized, "image/jpeg", image.width, image.height
+
+
+async def ingest_upload(file) -> IngestedImage:
+    """
+    Reads, validates and optimizes one uploaded image for the vision API.
+    Image processing runs in a worker thread to keep the event loop free.
+    """
+    data, digest = await read_upload(file)
+    return await ingest_data(data, digest, file.filename)
+
+
+async def ingest_data(data: bytes, digest: str, filename=None) -> IngestedImage:
+    """Validates and optimizes an upload already read by `read_upload`."""
+    if not data:
+        raise UnsupportedImageError(f"{filename or 'Upload'} is empty.")
+    mime_type = detect_mime_type(data[:16])
+    if mime_type is None and _pillow() is None:
+        raise UnsupportedImageError(f"{filename or 'Upload'} is not a supported image.")
+    original_size = len(data)
+    start = time.perf_counter()
+    optimized, mime_type, width, height = await asyncio.to_thread(optimize_image, data, mime_type)
+    observe_stage("image_optimize", time.perf_counter() - start)
+    del data
+    return IngestedImage(optimized, mime_type, digest, original_size, width, height)
@@ -0,0 +1,266 @@
+"""
+Asynchronous evaluation jobs backed by SQLite.
+
+A submitted job is stored as `queued` and picked up by a pool of worker
+tasks. Workers claim jobs through the database, so several processes can
+share one store. A job moves to `running` and then `succeeded` (with the
+result JSON) or `failed` (with an error message). Jobs left `running` by a
+crashed process are claimed again after JOB_LEASE seconds.
+"""
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from .admission import PRIORITY_INTERACTIVE, set_request_context
+from .batch_runner import error_detail
+from .env import env_float, env_int
+from .image_ingest import IngestedImage
+from .metrics import jobs_total, observe_stage
+from .payload_log import logger
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_QUEUED = 1000
+DEFAULT_LEASE = 600.0
+DEFAULT_RESULT_TTL = 24 * 3600
+POLL_INTERVAL = 1.0
+
+FINISHED = ("succeeded", "failed")
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at JOB_MAX_QUEUED."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobStore:
+    """SQLite persistence for jobs, their input images and results."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL,"
+                " tenant TEXT, priority INTEGER NOT NULL, essay_text TEXT,"
+                " result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL);"
+                "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created_at);"
+                "CREATE TABLE IF NOT EXISTS job_images ("
+                " job_id TEXT NOT NULL, position INTEGER NOT NULL, data BLOB NOT NULL, mime_type TEXT,"
+                " digest TEXT NOT NULL, original_size INTEGER, width INTEGER, height INTEGER,"
+                " PRIMARY KEY (job_id, position));"
+            )
+
+    def create(self, job_id, kind, essay_text, images, tenant, priority, now):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, kind, status, tenant, priority, essay_text, created_at)"
+                    " VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                    (job_id, kind, tenant, priority, essay_text, now),
+                )
+                self._conn.executemany(
+                    "INSERT INTO job_images VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(job_id, i, image.data, image.mime_type, image.digest, image.original_size,
+                      image.width, image.height) for i, image in enumerate(images)],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, result, error, created_at, started_at, finished_at"
+                " FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def count(self, status):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def claim(self, now, lease):
+        """Marks the next queued (or lease-expired) job as running and returns its row."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, kind, tenant, priority, essay_text, created_at FROM jobs"
+                    " WHERE status = 'queued' OR (status = 'running' AND started_at < ?)"
+                    " ORDER BY priority, created_at LIMIT 1",
+                    (now - lease,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (now, row["id"])
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return dict(row) if row is not None else None
+
+    def images(self, job_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data, mime_type, digest, original_size, width, height FROM job_images"
+                " WHERE job_id = ? ORDER BY position", (job_id,)
+            ).fetchall()
+        return [IngestedImage(*row) for row in rows]
+
+    def finish(self, job_id, status, result, error, now):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, result, error, now, job_id),
+            )
+            self._conn.execute("DELETE FROM job_images WHERE job_id = ?", (job_id,))
+
+    def purge_finished(self, before):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?", (before,)
+            )
+
+
+class JobQueue:
+    """
+    Runs stored jobs through `handler(kind, essay_text, images)` with a pool
+    of worker tasks, and lets callers wait for a job to finish.
+    """
+
+    def __init__(self, store: JobStore, handler, workers=DEFAULT_WORKERS, max_queued=DEFAULT_MAX_QUEUED,
+                 lease=DEFAULT_LEASE, result_ttl=DEFAULT_RESULT_TTL):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.lease = lease
+        self.result_ttl = result_ttl
+        self._tasks = []
+        self._wakeup = None
+        self._done = {}
+        self._avg_seconds = None
+        self._finished_since_purge = 0
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _retry_after(self, queued):
+        per_job = self._avg_seconds or 15.0
+        return max(1.0, queued * per_job / max(1, self.workers))
+
+    async def submit(self, kind, essay_text=None, images=(), tenant=None, priority=PRIORITY_INTERACTIVE):
+        """Stores a new job and returns its id; raises QueueFullError at JOB_MAX_QUEUED."""
+        queued = await asyncio.to_thread(self.store.count, "queued")
+        if queued >= self.max_queued:
+            jobs_total.inc(status="rejected")
+            raise QueueFullError("Too many evaluations are queued, please retry later.", self._retry_after(queued))
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(
+            self.store.create, job_id, kind, essay_text, list(images), tenant, priority, time.time()
+        )
+        jobs_total.inc(status="submitted")
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id):
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def wait(self, job_id, timeout):
+        """
+        Returns the job once it has finished or `timeout` seconds have passed.
+        Completion in this process wakes the waiter at once; jobs run by
+        another process are noticed by polling.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            job = await self.get(job_id)
+            remaining = deadline - loop.time()
+            if job is None or job["status"] in FINISHED or remaining <= 0:
+                if job is None or job["status"] in FINISHED:
+                    self._done.pop(job_id, None)
+                return job
+            event = self._done.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(remaining, POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            job = await asyncio.to_thread(self.store.claim, time.time(), self.lease)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job):
+        start = time.time()
+        observe_stage("job_queue", start - job["created_at"])
+        set_request_context(job["tenant"], job["priority"])
+        result = error = None
+        try:
+            images = await asyncio.to_thread(self.store.images, job["id"]) if job["kind"] != "text" else []
+            output = await self.handler(job["kind"], job["essay_text"], images)
+            result = output.model_dump_json()
+            status = "succeeded"
+        except Exception as e:
+            logger.warning("Job %s failed: %s", job["id"], e)
+            error = error_detail(e)
+            status = "failed"
+        finished = time.time()
+        await asyncio.to_thread(self.store.finish, job["id"], status, result, error, finished)
+        jobs_total.inc(status=status)
+        elapsed = finished - start
+        self._avg_seconds = elapsed if self._avg_seconds is None else 0.9 * self._avg_seconds + 0.1 * elapsed
+        event = self._done.pop(job["id"], None)
+        if event is not None:
+            event.set()
+        self._finished_since_purge += 1
+        if self.result_ttl and self._finished_since_purge >= 100:
+            self._finished_since_purge = 0
+            await asyncio.to_thread(self.store.purge_finished, finished - self.result_ttl)
+
+
+def job_db_path():
+    return os.environ.get("JOB_DB_PATH") or os.path.join(tempfile.gettempdir(), "ielts_jobs.sqlite3")
+
+
+def create_job_queue(handler) -> JobQueue:
+    """Builds a JobQueue for `handler`, configured from the environment."""
+    return JobQueue(
+        JobStore(job_db_path()),
+        handler,
+        workers=max(1, env_int("JOB_WORKERS", DEFAULT_WORKERS)),
+        max_queued=env_int("JOB_MAX_QUEUED", DEFAULT_MAX_QUEUED),
+        lease=env_float("JOB_LEASE", DEFAULT_LEASE),
+        result_ttl=env_int("JOB_RESULT_TTL", DEFAULT_RESULT_TTL),
+    )
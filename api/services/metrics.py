@@ -0,0 +1,271 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels, rendered in Prometheus text format."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up and down, rendered in Prometheus text format."""
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, rendered in Prometheus text format."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+stage_seconds = REGISTRY.register(Histogram(
+    "ielts_stage_duration_seconds",
+    "Time spent in each evaluation stage.",
+    ("stage",),
+))
+upstream_seconds = REGISTRY.register(Histogram(
+    "ielts_upstream_duration_seconds",
+    "Duration of upstream OpenAI calls, excluding time queued for a slot.",
+    ("model", "operation", "outcome"),
+))
+upstream_ttft_seconds = REGISTRY.register(Histogram(
+    "ielts_upstream_time_to_first_token_seconds",
+    "Time from sending a streaming request to the first content token.",
+    ("model",),
+))
+tokens_total = REGISTRY.register(Counter(
+    "ielts_openai_tokens_total",
+    "Tokens reported by OpenAI usage, by model and kind (prompt, completion, cached_prompt).",
+    ("model", "kind"),
+))
+estimated_tokens = REGISTRY.register(Histogram(
+    "ielts_estimated_tokens",
+    "Locally estimated tokens per upstream call, by stage and part "
+    "(system, input, image, schema prompt tokens and the max_output budget).",
+    ("stage", "part"),
+    buckets=(25, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+))
+upstream_retries_total = REGISTRY.register(Counter(
+    "ielts_upstream_retries_total",
+    "Upstream calls retried, by model and reason.",
+    ("model", "reason"),
+))
+upstream_hedges_total = REGISTRY.register(Counter(
+    "ielts_upstream_hedges_total",
+    "Hedged duplicate upstream requests, by model and which request answered first.",
+    ("model", "winner"),
+))
+circuit_open = REGISTRY.register(Gauge(
+    "ielts_upstream_circuit_open",
+    "1 while the circuit breaker for a model is open (failing fast), else 0.",
+    ("model",),
+))
+admission_queue_depth = REGISTRY.register(Gauge(
+    "ielts_admission_queue_depth",
+    "Upstream calls waiting for rate-limit budget, by model.",
+    ("model",),
+))
+admission_rejected_total = REGISTRY.register(Counter(
+    "ielts_admission_rejected_total",
+    "Requests shed with 429 because the wait for rate-limit budget exceeded the SLO.",
+    ("model", "priority"),
+))
+cascade_answers_total = REGISTRY.register(Counter(
+    "ielts_cascade_answers_total",
+    "Cascade evaluations by the tier (fast or strong) whose result was returned.",
+    ("tier", "model"),
+))
+cascade_escalations_total = REGISTRY.register(Counter(
+    "ielts_cascade_escalations_total",
+    "Escalation rules that fired on fast-tier results.",
+    ("reason",),
+))
+cascade_agreement_total = REGISTRY.register(Counter(
+    "ielts_cascade_agreement_total",
+    "Overall-band agreement between the fast and strong tier on the same essay.",
+    ("outcome",),
+))
+jobs_total = REGISTRY.register(Counter(
+    "ielts_jobs_total",
+    "Evaluation jobs by outcome: submitted, rejected (queue full), succeeded or failed.",
+    ("status",),
+))
+http_request_seconds = REGISTRY.register(Histogram(
+    "ielts_http_request_duration_seconds",
+    "End-to-end HTTP request duration, including streamed bodies.",
+    ("method", "route", "status"),
+))
+
+
+def observe_stage(stage, seconds):
+    stage_seconds.observe(seconds, stage=stage)
+
+
+@contextmanager
+def timed_stage(stage):
+    """Records the duration of the enclosed block under `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_usage(model, usage):
+    """Adds the token usage of one completion to the token counters."""
+    if usage is None:
+        return
+    tokens_total.inc(usage.prompt_tokens or 0, model=model, kind="prompt")
+    tokens_total.inc(usage.completion_tokens or 0, model=model, kind="completion")
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached:
+        tokens_total.inc(cached, model=model, kind="cached_prompt")
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording request duration by route template, measured
+    until the last body chunk is sent so streamed responses count in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - start,
+                method=scope.get("method", ""),
+                route=getattr(route, "path", "unmatched"),
+                status=status["code"],
+            )
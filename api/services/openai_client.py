@@ -0,0 +1,466 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING
+
+from .admission import AdmissionRejectedError, get_admission, get_request_context
+from .env import env_float, env_int
+from .metrics import (
+    observe_stage,
+    record_usage,
+    upstream_hedges_total,
+    upstream_retries_total,
+    upstream_seconds,
+    upstream_ttft_seconds,
+)
+from .token_budget import plan_call
+from .resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyTracker,
+    backoff_delay,
+    is_api_error,
+    is_provider_failure,
+    is_retryable,
+    retry_after_seconds,
+)
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+# Settings are read lazily so that `load_dotenv()` in the app module has run
+# before the first upstream call.
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 60.0
+DEFAULT_QUEUE_TIMEOUT = 30.0
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_RETRY_BASE_DELAY = 0.5
+DEFAULT_RETRY_MAX_DELAY = 8.0
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_RESET = 30.0
+DEFAULT_HEDGE_QUANTILE = 0.95
+DEFAULT_HEDGE_MIN_DELAY = 1.0
+
+_client = None
+_semaphore = None
+_breakers = {}
+_latencies = {}
+# Model of the upstream call in progress, for the rate-limit header hook
+_current_model = ContextVar("upstream_model", default="")
+
+
+class UpstreamBusyError(Exception):
+    """Raised when no upstream slot frees up within the queue timeout."""
+
+
+class UpstreamTimeoutError(Exception):
+    """Raised when an upstream call exceeds its overall deadline."""
+
+
+class UpstreamUnavailableError(CircuitOpenError):
+    """Raised without calling upstream while the model's circuit breaker is open."""
+
+
+class UpstreamAPIError(Exception):
+    """An error response or connection failure from the provider that retries didn't resolve."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _final_error(exc):
+    # SDK errors are re-raised as our own type, so callers can handle them
+    # without importing `openai` up front
+    if is_api_error(exc):
+        return UpstreamAPIError(str(exc), getattr(exc, "status_code", None))
+    return exc
+
+
+def max_concurrency() -> int:
+    return max(1, env_int("OPENAI_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+
+
+def _http2_enabled():
+    if os.environ.get("OPENAI_HTTP2", "1") == "0":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+async def _observe_rate_limits(response):
+    model = _current_model.get()
+    if model:
+        get_admission(model).budget.observe_headers(response.headers, response.status_code)
+
+
+def get_client() -> "AsyncOpenAI":
+    """
+    Returns the shared AsyncOpenAI client, creating it (and importing the
+    SDK, the slowest import in the app) on first use.
+
+    All calls share one keep-alive connection pool sized from
+    OPENAI_MAX_CONCURRENCY, over HTTP/2 when the `h2` package is installed.
+    The SDK's own retries are off; `run_limited` retries instead. Rate-limit
+    headers of every response feed the model's admission budget.
+    """
+    global _client
+    if _client is None:
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        connections = max_concurrency()
+        http_client = DefaultAsyncHttpxClient(
+            http2=_http2_enabled(),
+            timeout=stage_timeout(""),
+            event_hooks={"response": [_observe_rate_limits]},
+            limits=httpx.Limits(
+                # Headroom for hedged duplicates
+                max_connections=connections * 2,
+                max_keepalive_connections=connections,
+                keepalive_expiry=env_float("OPENAI_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY),
+            ),
+        )
+        _client = AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            base_url=os.environ.get("OPENAI_BASE_URL") or None,
+            http_client=http_client,
+            max_retries=0,
+        )
+    return _client
+
+
+async def warm_up(connections=1) -> int:
+    """
+    Builds the client and opens up to `connections` keep-alive connections
+    to the provider (one cheap `GET /models` each), so the first evaluation
+    pays neither the SDK import nor the TCP/TLS handshake. Returns how many
+    requests got a response; an error status still leaves a warm connection.
+    """
+    client = get_client()
+    connections = max(1, min(connections, max_concurrency()))
+    results = await asyncio.gather(
+        *[client.models.list(timeout=stage_timeout("")) for _ in range(connections)], return_exceptions=True
+    )
+    return sum(1 for r in results if not isinstance(r, Exception) or hasattr(r, "status_code"))
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max_concurrency())
+    return _semaphore
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = _breakers[model] = CircuitBreaker(
+            model,
+            failure_threshold=env_int("OPENAI_BREAKER_THRESHOLD", DEFAULT_BREAKER_THRESHOLD),
+            reset_timeout=env_float("OPENAI_BREAKER_RESET", DEFAULT_BREAKER_RESET),
+        )
+    return breaker
+
+
+def circuit_is_open(model: str) -> bool:
+    return get_breaker(model).state == "open"
+
+
+def stage_timeout(stage: str) -> "httpx.Timeout":
+    """
+    Connect/read timeout for a pipeline stage: OPENAI_READ_TIMEOUT_<STAGE>
+    (e.g. OPENAI_READ_TIMEOUT_TRANSCRIBE), falling back to OPENAI_READ_TIMEOUT.
+    """
+    import httpx
+
+    read_timeout = env_float("OPENAI_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)
+    if stage:
+        read_timeout = env_float(f"OPENAI_READ_TIMEOUT_{stage.upper()}", read_timeout)
+    connect_timeout = env_float("OPENAI_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)
+    return httpx.Timeout(read_timeout, connect=connect_timeout)
+
+
+def _total_timeout(stage=""):
+    timeout = stage_timeout(stage)
+    return env_float("OPENAI_TOTAL_TIMEOUT", timeout.read + timeout.connect)
+
+
+def _retry_delay(exc, attempt):
+    delay = retry_after_seconds(exc)
+    if delay is None:
+        delay = backoff_delay(
+            attempt,
+            env_float("OPENAI_RETRY_BASE_DELAY", DEFAULT_RETRY_BASE_DELAY),
+            env_float("OPENAI_RETRY_MAX_DELAY", DEFAULT_RETRY_MAX_DELAY),
+        )
+    return delay
+
+
+def _record_outcome(breaker, exc):
+    if is_provider_failure(exc) or isinstance(exc, UpstreamTimeoutError):
+        breaker.record_failure()
+    else:
+        breaker.release_probe()
+
+
+def _check_breaker(breaker):
+    try:
+        breaker.before_call()
+    except CircuitOpenError as e:
+        raise UpstreamUnavailableError(str(e), e.retry_after)
+
+
+@asynccontextmanager
+async def upstream_slot():
+    """
+    Holds one of the OPENAI_MAX_CONCURRENCY upstream slots for the duration
+    of the block. Waiting for a slot is bounded by OPENAI_QUEUE_TIMEOUT.
+    """
+    semaphore = _get_semaphore()
+    queue_timeout = env_float("OPENAI_QUEUE_TIMEOUT", DEFAULT_QUEUE_TIMEOUT)
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=queue_timeout)
+    except asyncio.TimeoutError:
+        raise UpstreamBusyError("Too many evaluations in progress, please retry shortly.")
+    finally:
+        observe_stage("upstream_queue", time.perf_counter() - start)
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def _hedge_delay(model, operation):
+    """
+    Seconds after which a duplicate request is sent (OPENAI_HEDGE=1): either
+    OPENAI_HEDGE_AFTER or the recent p95 latency of this model and operation.
+    None when hedging is off or there are too few samples yet.
+    """
+    if os.environ.get("OPENAI_HEDGE", "0") == "0":
+        return None
+    if os.environ.get("OPENAI_HEDGE_AFTER"):
+        return env_float("OPENAI_HEDGE_AFTER", None)
+    tracker = _latencies.get((model, operation))
+    delay = tracker.quantile(DEFAULT_HEDGE_QUANTILE) if tracker else None
+    if delay is None:
+        return None
+    return max(delay, env_float("OPENAI_HEDGE_MIN_DELAY", DEFAULT_HEDGE_MIN_DELAY))
+
+
+async def _cancel(task):
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+
+
+async def _admit(model, tokens):
+    """Waits for the model's rate-limit budget, queued by the caller's tenant and priority."""
+    _current_model.set(model)
+    tenant, priority = get_request_context()
+    await get_admission(model).admit(tokens, tenant, priority)
+
+
+async def _hedged(make_call, model, hedge_delay, timeout, tokens):
+    """
+    Runs `make_call()`; if it is still running after `hedge_delay` seconds and
+    a spare upstream slot and rate-limit budget are free, sends a duplicate
+    and returns whichever succeeds first, cancelling the other.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    primary = asyncio.ensure_future(make_call())
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+    except asyncio.CancelledError:
+        await _cancel(primary)
+        raise
+    semaphore = _get_semaphore()
+    budget = get_admission(model).budget
+    if done or semaphore.locked() or budget.delay(tokens) > 0:
+        return await asyncio.wait_for(primary, timeout=deadline - loop.time())
+
+    await semaphore.acquire()
+    budget.consume(tokens)
+    hedge = asyncio.ensure_future(make_call())
+    names = {primary: "primary", hedge: "hedge"}
+    pending = {primary, hedge}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise asyncio.TimeoutError()
+            for task in done:
+                if task.exception() is None:
+                    upstream_hedges_total.inc(model=model, winner=names[task])
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in (primary, hedge):
+            if not task.done():
+                await _cancel(task)
+        semaphore.release()
+
+
+async def _attempt(make_call, model, operation, timeout, tokens):
+    async with upstream_slot():
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            hedge_delay = _hedge_delay(model, operation)
+            if hedge_delay is not None and hedge_delay < timeout:
+                result = await _hedged(make_call, model, hedge_delay, timeout, tokens)
+            else:
+                result = await asyncio.wait_for(make_call(), timeout=timeout)
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise UpstreamTimeoutError(f"Upstream model call exceeded {timeout:.0f} seconds.")
+        finally:
+            elapsed = time.perf_counter() - start
+            upstream_seconds.observe(elapsed, model=model, operation=operation, outcome=outcome)
+    _latencies.setdefault((model, operation), LatencyTracker()).add(elapsed)
+    return result
+
+
+async def run_limited(make_call, timeout=None, model="", operation="", stage="", tokens=0):
+    """
+    Runs `make_call()` (a coroutine factory) once the model's rate-limit
+    budget admits `tokens` estimated tokens and an upstream slot is free.
+
+    After admission, the whole call, retries included, is bounded by
+    `timeout` (defaults to OPENAI_TOTAL_TIMEOUT, or the stage's connect + read
+    timeout). Connection errors, timeouts, 429s and 5xx are retried up to
+    OPENAI_MAX_RETRIES times with jittered backoff, honouring Retry-After.
+    Each retry is admitted against the budget again. Repeated provider failures
+    open the model's circuit breaker, after which calls fail fast with
+    UpstreamUnavailableError. Duration and token usage are recorded under
+    `model` and `operation`.
+    """
+    if timeout is None:
+        timeout = _total_timeout(stage)
+    loop = asyncio.get_running_loop()
+    deadline = None
+    breaker = get_breaker(model)
+    max_retries = env_int("OPENAI_MAX_RETRIES", DEFAULT_MAX_RETRIES)
+    attempt = 0
+    while True:
+        _check_breaker(breaker)
+        try:
+            await _admit(model, tokens)
+            if deadline is None:
+                deadline = loop.time() + timeout
+            result = await _attempt(make_call, model, operation, deadline - loop.time(), tokens)
+        except (UpstreamBusyError, AdmissionRejectedError, asyncio.CancelledError):
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            _record_outcome(breaker, e)
+            if attempt >= max_retries or not (is_retryable(e) or isinstance(e, UpstreamTimeoutError)):
+                raise _final_error(e)
+            delay = _retry_delay(e, attempt)
+            # Not worth retrying if the backoff would eat the rest of the deadline
+            if loop.time() + delay >= deadline - 1.0:
+                raise _final_error(e)
+            upstream_retries_total.inc(model=model, reason=getattr(e, "status_code", None) or type(e).__name__)
+            attempt += 1
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        record_usage(model, getattr(result, "usage", None))
+        return result
+
+
+async def parse_completion(stage="score", **kwargs):
+    """Structured-output chat completion (`beta.chat.completions.parse`)."""
+    client = get_client()
+    kwargs.setdefault("timeout", stage_timeout(stage))
+    return await run_limited(
+        lambda: client.beta.chat.completions.parse(**kwargs),
+        model=kwargs.get("model", ""), operation="parse", stage=stage, tokens=plan_call(stage, kwargs),
+    )
+
+
+async def stream_parsed_completion(stage="stream", **kwargs):
+    """
+    Structured-output streaming (`beta.chat.completions.stream`). Once
+    admitted, yields the stream events while holding an upstream slot; the
+    overall deadline is checked between events. Failures are retried like `run_limited`, but only
+    before the first event has been yielded. Time to first token and usage
+    are recorded.
+    """
+    client = get_client()
+    model = kwargs.get("model", "")
+    kwargs.setdefault("stream_options", {"include_usage": True})
+    kwargs.setdefault("timeout", stage_timeout(stage))
+    tokens = plan_call(stage, kwargs)
+    timeout = _total_timeout(stage)
+    loop = asyncio.get_running_loop()
+    deadline = None
+    breaker = get_breaker(model)
+    max_retries = env_int("OPENAI_MAX_RETRIES", DEFAULT_MAX_RETRIES)
+    attempt = 0
+    while True:
+        _check_breaker(breaker)
+        try:
+            await _admit(model, tokens)
+        except BaseException:
+            breaker.release_probe()
+            raise
+        if deadline is None:
+            deadline = loop.time() + timeout
+        error = None
+        yielded = False
+        first_token = True
+        async with upstream_slot():
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                async with client.beta.chat.completions.stream(**kwargs) as stream:
+                    async for event in stream:
+                        if loop.time() > deadline:
+                            outcome = "timeout"
+                            raise UpstreamTimeoutError(f"Upstream model call exceeded {timeout:.0f} seconds.")
+                        # The first event is a raw `chunk`; time to first token is the first content delta
+                        if first_token and event.type == "content.delta":
+                            first_token = False
+                            upstream_ttft_seconds.observe(time.perf_counter() - start, model=model)
+                        yielded = True
+                        yield event
+                    completion = await stream.get_final_completion()
+                outcome = "ok"
+            except Exception as e:
+                _record_outcome(breaker, e)
+                if yielded or attempt >= max_retries or not is_retryable(e):
+                    raise _final_error(e)
+                error = e
+            except BaseException:
+                breaker.release_probe()
+                raise
+            finally:
+                upstream_seconds.observe(time.perf_counter() - start, model=model, operation="stream", outcome=outcome)
+        if error is None:
+            breaker.record_success()
+            record_usage(model, completion.usage)
+            return
+        delay = _retry_delay(error, attempt)
+        if loop.time() + delay >= deadline - 1.0:
+            raise _final_error(error)
+        upstream_retries_total.inc(model=model, reason=getattr(error, "status_code", None) or type(error).__name__)
+        attempt += 1
+        await asyncio.sleep(delay)
@@ -0,0 +1,54 @@
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from .env import env_float
+
+DEFAULT_SAMPLE_RATE = 0.01
+
+logger = logging.getLogger("ielts")
+
+_listener = None
+
+
+def _setup():
+    """
+    Sends `ielts` log records through an in-memory queue; a background thread
+    writes them to stderr, so request handlers never block on log I/O.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _listener = QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    logger.addHandler(QueueHandler(records))
+    logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+
+_setup()
+
+
+def payload_sample_rate() -> float:
+    return env_float("PAYLOAD_LOG_SAMPLE_RATE", DEFAULT_SAMPLE_RATE)
+
+
+def log_payload(message: str, payload):
+    """
+    Logs the full JSON of a pydantic model for a sample of calls
+    (PAYLOAD_LOG_SAMPLE_RATE, default 1%). Unsampled calls don't serialize it.
+    """
+    rate = payload_sample_rate()
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info("%s %s", message, payload.model_dump_json())
@@ -0,0 +1,256 @@
+"""
+Local pre-screening of essays before any model call.
+
+`screen_essays` computes cheap text features (word, sentence and paragraph
+counts, type-token ratio, repeated text, script and language checks,
+linking-word density) for a list of essays in one pass, and turns them
+into an instant rejection for input that can't be graded, or warnings for
+input that can. A leading task question is split off first (`split_topic`),
+so the features, and the IELTS length check, describe the essay alone. The
+features are also handed to the scorer, so the model doesn't have to count
+them itself.
+"""
+import os
+import re
+
+from .env import env_int
+
+IELTS_MIN_WORDS = 250
+DEFAULT_MIN_WORDS = 50
+# Sentences and paragraphs shorter than this aren't checked for repeats
+REPEAT_MIN_WORDS = 5
+# Longest first paragraph taken as the task question, and as a bare title line
+TOPIC_MAX_WORDS = 80
+TITLE_MAX_WORDS = 15
+
+_WORD = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+_NON_WORD = re.compile(r"[\W_]+")
+# "Topic: ...", "Question 2. ...", "Essay 14: ..."
+_TOPIC_LABEL = re.compile(r"(topic|question|task|title|prompt|essay)\s*\d*\s*[:.)-]", re.IGNORECASE)
+# Closing instructions of Task 2 questions, e.g. "Discuss both views and give your own opinion."
+_TASK_INSTRUCTION = re.compile(
+    r"(discuss|to what extent|do you agree|what is your opinion|give reasons|write at least|explain)\b",
+    re.IGNORECASE,
+)
+
+# Common English function words; even short English prose is full of them
+_ENGLISH_WORDS = frozenset(
+    "a an the and or but if of to in on at by for with from as is are was were be been being it its "
+    "this that these those there their they them he she his her we our you your i my me not no do does "
+    "did have has had can could will would should may might must which who whom what when where why how "
+    "so than then also more most some any all many much such".split()
+)
+_LINKING_PHRASES = [
+    tuple(phrase.split()) for phrase in (
+        "however", "moreover", "furthermore", "additionally", "in addition", "therefore", "thus", "hence",
+        "consequently", "as a result", "for example", "for instance", "such as", "in conclusion",
+        "to conclude", "to sum up", "overall", "firstly", "secondly", "thirdly", "finally", "lastly",
+        "on the other hand", "in contrast", "whereas", "although", "even though", "nevertheless",
+        "nonetheless", "similarly", "likewise", "meanwhile", "in other words", "because",
+    )
+]
+# First word -> phrases starting with it, longest first
+_LINKING = {}
+for _phrase in sorted(_LINKING_PHRASES, key=len, reverse=True):
+    _LINKING.setdefault(_phrase[0], []).append(_phrase)
+
+
+class EssayRejectedError(ValueError):
+    """Raised for essays the pre-screen rejects, before any model call."""
+
+    def __init__(self, message, reason, features):
+        super().__init__(message)
+        self.reason = reason
+        self.features = features
+
+
+def count_words(text: str) -> int:
+    """Whitespace-separated words, as IELTS word counts are done."""
+    return len(text.split())
+
+
+def split_topic(text: str):
+    """
+    Returns (topic, essay) with the task question split off the essay: a
+    first paragraph of at most TOPIC_MAX_WORDS words that ends with a
+    question, ends with a task instruction ("Discuss both views..."), is
+    labelled ("Topic: ..."), or is a title line without closing punctuation.
+    The topic is empty when the essay doesn't start with one.
+    """
+    stripped = text.strip()
+    parts = _PARAGRAPH_BREAK.split(stripped, maxsplit=1)
+    if len(parts) < 2 or not parts[1].strip():
+        return "", stripped
+    first = parts[0].strip()
+    words = count_words(first)
+    if words > TOPIC_MAX_WORDS:
+        return "", stripped
+    last_sentence = _SENTENCE_BREAK.split(first)[-1]
+    if (
+        first.endswith("?")
+        or _TOPIC_LABEL.match(first)
+        or _TASK_INSTRUCTION.match(last_sentence)
+        or (words <= TITLE_MAX_WORDS and "\n" not in first and first[-1] not in ".!")
+    ):
+        return first, parts[1].strip()
+    return "", stripped
+
+
+def essay_word_count(text: str) -> int:
+    """Words of the essay without its task question, as the IELTS length requirement counts them."""
+    return count_words(split_topic(text)[1])
+
+
+def _count_linking(words):
+    count = resume = 0
+    for i, word in enumerate(words):
+        if i < resume or word not in _LINKING:
+            continue
+        for phrase in _LINKING[word]:
+            if tuple(words[i:i + len(phrase)]) == phrase:
+                count += 1
+                resume = i + len(phrase)
+                break
+    return count
+
+
+def _repeats(chunks):
+    """(number of chunks, words in them) repeating an earlier chunk, ignoring punctuation."""
+    seen = set()
+    count = words = 0
+    for chunk in chunks:
+        key = _NON_WORD.sub(" ", chunk).strip()
+        size = key.count(" ") + 1 if key else 0
+        if size < REPEAT_MIN_WORDS:
+            continue
+        if key in seen:
+            count += 1
+            words += size
+        seen.add(key)
+    return count, words
+
+
+def essay_features(text: str) -> dict:
+    """Features of the essay without its task question; `topic_word_count` counts the question."""
+    topic, text = split_topic(text)
+    lower = text.lower()
+    words = _WORD.findall(lower)
+    word_count = count_words(text)
+    paragraphs = [p for p in _PARAGRAPH_BREAK.split(lower.strip()) if p.strip()]
+    sentences = [s for p in paragraphs for s in _SENTENCE_BREAK.split(p.strip()) if s.strip()]
+    joined = "".join(words)
+    letters = len(joined)
+    ascii_letters = len(joined.encode("ascii", "ignore"))
+    english_words = sum(map(_ENGLISH_WORDS.__contains__, words))
+    duplicate_paragraphs, _ = _repeats(paragraphs)
+    _, repeated_words = _repeats(sentences)
+    linking = _count_linking(words)
+    return {
+        "word_count": word_count,
+        "topic_word_count": count_words(topic),
+        "paragraph_count": len(paragraphs),
+        "sentence_count": len(sentences),
+        "type_token_ratio": round(len(set(words)) / len(words), 3) if words else 0.0,
+        "duplicate_paragraphs": duplicate_paragraphs,
+        "repeated_text_ratio": round(repeated_words / len(words), 3) if words else 0.0,
+        "latin_script_ratio": round(ascii_letters / letters, 3) if letters else 0.0,
+        "english_word_ratio": round(english_words / len(words), 3) if words else 0.0,
+        "linking_words": linking,
+        "linking_words_per_100": round(linking * 100 / word_count, 2) if word_count else 0.0,
+    }
+
+
+class Screening:
+    """Features of one essay, plus its rejection (reason, message) or warnings."""
+
+    __slots__ = ("features", "rejection", "warnings")
+
+    def __init__(self, features, rejection=None, warnings=()):
+        self.features = features
+        self.rejection = rejection
+        self.warnings = list(warnings)
+
+    def raise_if_rejected(self):
+        if self.rejection is not None:
+            reason, message = self.rejection
+            raise EssayRejectedError(message, reason, self.features)
+
+    def to_dict(self):
+        return {
+            "features": self.features,
+            "warnings": [{"code": code, "message": message} for code, message in self.warnings],
+        }
+
+    def prompt_note(self) -> str:
+        """The features as a short note for the scoring prompt."""
+        f = self.features
+        topic = (
+            f"not counting the {f['topic_word_count']}-word task question" if f["topic_word_count"]
+            else "no task question found"
+        )
+        return (
+            "Text statistics of the essay (computed exactly; use them instead of counting): "
+            f"{f['word_count']} words ({topic}), {f['paragraph_count']} paragraphs, "
+            f"{f['sentence_count']} sentences, type-token ratio {f['type_token_ratio']}, "
+            f"{f['linking_words']} linking words ({f['linking_words_per_100']} per 100 words), "
+            f"{f['duplicate_paragraphs']} repeated paragraphs."
+        )
+
+
+def _min_words():
+    return env_int("PRESCREEN_MIN_WORDS", DEFAULT_MIN_WORDS)
+
+
+def _problems(f, min_words):
+    """Yields (reason, message, fatal) for one essay's features."""
+    if f["word_count"] < min_words:
+        yield "too_short", (
+            f"The essay is too short to grade ({f['word_count']} words; at least {min_words} are needed)."
+        ), True
+    if f["word_count"] and f["latin_script_ratio"] < 0.8:
+        yield "charset", "The essay must be written in English; most of the text is in another script.", True
+    elif f["word_count"] >= min_words and f["english_word_ratio"] < 0.15:
+        yield "language", "The essay does not appear to be written in English.", True
+    if f["repeated_text_ratio"] >= 0.5:
+        yield "duplicate", "Most of the essay repeats the same text; it looks pasted more than once.", True
+    elif f["duplicate_paragraphs"] or f["repeated_text_ratio"] >= 0.2:
+        yield "repeated_text", "Parts of the essay are repeated word for word.", False
+    if f["word_count"] < IELTS_MIN_WORDS:
+        yield "under_length", (
+            f"Task 2 essays need at least {IELTS_MIN_WORDS} words; this one has {f['word_count']}, "
+            "which lowers the Task Response band."
+        ), False
+    if f["paragraph_count"] == 1 and f["word_count"] >= 150:
+        yield "single_paragraph", "The essay is one paragraph; paragraphing affects Coherence and Cohesion.", False
+    if f["word_count"] >= 150 and f["type_token_ratio"] < 0.35:
+        yield "low_variety", "The essay repeats a small set of words.", False
+    if f["word_count"] >= min_words and not f["linking_words"]:
+        yield "no_linking_words", "The essay uses no linking words.", False
+    elif f["linking_words_per_100"] > 8:
+        yield "overused_linking_words", "Linking words are used very densely, which can read as mechanical.", False
+
+
+def screen_essays(texts) -> list:
+    """
+    Screens a list of essays in one pass (a whole batch upload at once).
+    With PRESCREEN_REJECT=0 every problem is reported as a warning instead.
+    """
+    min_words = _min_words()
+    reject = os.environ.get("PRESCREEN_REJECT", "1") != "0"
+    screenings = []
+    for text in texts:
+        features = essay_features(text)
+        rejection, warnings = None, []
+        for reason, message, fatal in _problems(features, min_words):
+            if fatal and reject and rejection is None:
+                rejection = (reason, message)
+            else:
+                warnings.append((reason, message))
+        screenings.append(Screening(features, rejection, warnings))
+    return screenings
+
+
+def screen_essay(text: str) -> Screening:
+    return screen_essays([text])[0]
@@ -0,0 +1,156 @@
+import email.utils
+import random
+import time
+from collections import deque
+
+from .metrics import circuit_open
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit breaker is open."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# `openai` is imported inside the helpers: it is slow to import, and by the
+# time they see one of its exceptions it has been loaded anyway.
+
+
+def is_retryable(exc) -> bool:
+    """Connection problems, timeouts, 408/409/429 and 5xx responses are worth retrying."""
+    import openai
+
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+
+def is_provider_failure(exc) -> bool:
+    """Failures that suggest the provider is degraded (429 is a quota issue, not an outage)."""
+    import openai
+
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+
+def is_api_error(exc) -> bool:
+    """Error responses and connection failures raised by the OpenAI SDK."""
+    import openai
+
+    return isinstance(exc, openai.APIError)
+
+
+def is_invalid_output(exc) -> bool:
+    """Completions cut off by max_tokens or the content filter, which structured outputs can't parse."""
+    import openai
+
+    return isinstance(exc, (openai.LengthFinishReasonError, openai.ContentFilterFinishReasonError))
+
+
+def retry_after_seconds(exc):
+    """Reads `retry-after-ms` / `retry-after` from an error response, if any."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+def backoff_delay(attempt, base, cap):
+    """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` provider failures in a row the circuit opens and
+    calls fail fast for `reset_timeout` seconds. Then a single probe call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return
+        retry_after = max(1.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+        raise CircuitOpenError(
+            f"The model provider is currently unavailable ({self.name}); please retry shortly.",
+            retry_after,
+        )
+
+    def record_success(self):
+        self._failures = 0
+        self._probing = False
+        if self._opened_at is not None:
+            self._opened_at = None
+            circuit_open.set(0, model=self.name)
+
+    def record_failure(self):
+        self._failures += 1
+        if self._probing or self._failures >= self.failure_threshold:
+            self._probing = False
+            self._opened_at = time.monotonic()
+            circuit_open.set(1, model=self.name)
+
+    def release_probe(self):
+        """Ends a half-open probe that finished without a verdict (e.g. a 400)."""
+        self._probing = False
+
+
+class LatencyTracker:
+    """Rolling window of call latencies, used to pick the hedging delay."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def quantile(self, q, min_samples=20):
+        if len(self._samples) < min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
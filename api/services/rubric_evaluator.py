@@ -1,11 +1,19 @@
-import pandas as pd
+import csv
+import hashlib
+import json
+import math
 import os
+import re
+import threading
 
-# RUBRIC_PATH = os.path.join(os.path.dirname(__file__), "../../data/rubrics.csv")
+from .payload_log import logger
 
-import pandas as pd
+# Optional CSV override with the same columns as `rubric_data` below
+# (Criteria, Description, Band 9, Band 7, ...). Without it the built-in
+# rubric is used.
+RUBRIC_PATH_ENV = "RUBRIC_PATH"
 
-# Predefined IELTS scoring rubric as a pandas DataFrame
+# Predefined IELTS scoring rubric, one list per column
 rubric_data = {
     "Criteria": [
         "Task Response",
@@ -45,97 +53,215 @@ rubric_data = {
     ]
 }
 
-# Convert to a pandas DataFrame
-rubric_df = pd.DataFrame(rubric_data)
 
+def _read_rubric_csv(path):
+    """Reads a rubric CSV into the column-list layout used by `rubric_data`."""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        columns = {name.strip(): [] for name in reader.fieldnames or []}
+        for row in reader:
+            for name, value in row.items():
+                # Fields beyond the header are collected under None; ignore them
+                if name is not None:
+                    columns[name.strip()].append((value or "").strip())
+    if "Criteria" not in columns or "Description" not in columns:
+        raise ValueError(f"Rubric CSV {path} needs 'Criteria' and 'Description' columns")
+    return columns
 
 
+def _rubric_version(rubric):
+    payload = json.dumps(rubric, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:12]
+
+
+def _render_system_prompt(rubric):
+    rubric_text = "\n".join(
+        [f"- **{criterion}**: {description}"
+         for criterion, description in zip(rubric["Criteria"], rubric["Description"])]
+    )
+
+    bands = [column for column in rubric if column.startswith("Band ")]
+    band_scores_text = "\n".join(
+        [f"**{band}**: " + ", ".join(
+            [f"{criterion}: {score}" for criterion, score in zip(rubric["Criteria"], rubric[band])]
+        ) for band in bands]
+    )
+
+    # The system prompt only depends on the rubric, so it is byte-identical
+    # across requests and the provider can cache it as a prompt prefix. The
+    # output schema is sent as `response_format`, so it isn't repeated here.
+    return f"""You are an expert examiner evaluating writing responses based on the following rubric:
+
+### **Evaluation Criteria**
+{rubric_text}
+
+### **Band Descriptors**
+{band_scores_text}
+
+Your task:
+- Identify the topic/question in the response.
+- Score the essay based on the rubric.
+- Provide structured feedback for each criterion.
+- Give actionable improvement suggestions.
+"""
+
+
+def overall_band(scores) -> float:
+    """IELTS overall band: the mean of the criterion scores, rounded to the nearest half band (.25 and .75 round up)."""
+    average = sum(scores) / len(scores)
+    decimal_part = average - math.floor(average)
+    if decimal_part < 0.25:
+        return math.floor(average)
+    if decimal_part >= 0.75:
+        return math.ceil(average)
+    return math.floor(average) + 0.5
+
+
+def criterion_key(criterion: str) -> str:
+    """Maps a rubric criterion name to its score field, e.g. "Coherence & Cohesion" -> coherence_and_cohesion."""
+    words = re.findall(r"[a-z]+", criterion.lower().replace("&", " and "))
+    return "_".join(words)
+
+
+def _render_criterion_prompt(rubric, key):
+    index = next(i for i, criterion in enumerate(rubric["Criteria"]) if criterion_key(criterion) == key)
+    criterion = rubric["Criteria"][index]
+    bands = [column for column in rubric if column.startswith("Band ")]
+    band_text = "\n".join(f"- **{band}**: {rubric[band][index]}" for band in bands)
+    topic_task = (
+        "- Identify the topic/question in the response, or write a fitting one if it has none.\n"
+        if key == "task_response" else ""
+    )
+    return f"""You are an expert examiner scoring one criterion of IELTS writing responses.
+
+### **{criterion}**
+{rubric["Description"][index]}
+
+### **Band Descriptors**
+{band_text}
+
+Your task:
+{topic_task}- Score the essay for {criterion} only, from 0 to 9 in half-band steps.
+- Give two or three sentences of feedback on {criterion}.
+- Give up to three actionable suggestions to improve {criterion}.
+"""
+
+
+class RubricRegistry:
+    """
+    Parses the rubric once and keeps rendered prompts keyed by rubric version.
+
+    When RUBRIC_PATH points to a CSV file, the file is re-read only after its
+    modification time changes; otherwise the built-in `rubric_data` is used.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._source = None
+        self._rubric = None
+        self._version = None
+        self._prompts = {}
+        self._warned = None
+
+    def _warn(self, error):
+        # The source is checked on every evaluation; report each problem once
+        message = f"Error loading rubric: {error}"
+        if message != self._warned:
+            self._warned = message
+            logger.warning(message)
+
+    def _source_key(self):
+        path = os.environ.get(RUBRIC_PATH_ENV)
+        if not path:
+            return None
+        try:
+            return (path, os.stat(path).st_mtime_ns)
+        except OSError as e:
+            self._warn(e)
+            return None
+
+    def _refresh(self):
+        source = self._source_key()
+        if self._rubric is not None and source == self._source:
+            return
+        with self._lock:
+            if self._rubric is not None and source == self._source:
+                return
+            rubric = rubric_data
+            if source is not None:
+                try:
+                    rubric = _read_rubric_csv(source[0])
+                except (OSError, ValueError, csv.Error) as e:
+                    self._warn(e)
+                    rubric = self._rubric or rubric_data
+            self._rubric = rubric
+            self._version = _rubric_version(rubric)
+            self._source = source
+
+    def rubric(self):
+        self._refresh()
+        return self._rubric
+
+    def version(self):
+        self._refresh()
+        return self._version
+
+    def criteria(self):
+        """Score field keys of the active rubric's criteria, in rubric order."""
+        return [criterion_key(criterion) for criterion in self.rubric()["Criteria"]]
+
+    def criterion_prompt(self, key):
+        self._refresh()
+        cache_key = (self._version, key)
+        prompt = self._prompts.get(cache_key)
+        if prompt is None:
+            prompt = self._prompts[cache_key] = _render_criterion_prompt(self._rubric, key)
+        return prompt
+
+    def system_prompt(self):
+        self._refresh()
+        version = self._version
+        prompt = self._prompts.get(version)
+        if prompt is None:
+            prompt = self._prompts[version] = _render_system_prompt(self._rubric)
+        return prompt
+
+
+registry = RubricRegistry()
+
 
 def load_rubric():
     """
-    Loads rubrics from a CSV file and converts them into a dictionary.
+    Returns the current rubric as a dictionary of column lists.
     Returns:
         rubric_dict (dict): A dictionary representation of the rubric.
     """
-    try:
-        # df = pd.read_csv(RUBRIC_PATH)
-        df = rubric_df.copy()
-        
-        rubric_dict = {
-            "Criteria": df["Criteria"].tolist(),
-            "Description": df["Description"].tolist(),
-            "Band 9": df["Band 9"].tolist(),
-            "Band 7": df["Band 7"].tolist(),
-            "Band 5": df["Band 5"].tolist(),
-            "Band 3": df["Band 3"].tolist()
-        }
-        return rubric_dict
-    except Exception as e:
-        print(f"Error loading rubric: {e}")
-        return {}
+    return {column: list(values) for column, values in registry.rubric().items()}
+
+
+def get_rubric_version():
+    """
+    Returns a short content hash identifying the active rubric.
+    """
+    return registry.version()
+
 
 def generate_system_prompt():
     """
-    Generates a system prompt dynamically based on the rubric loaded from a CSV file.
+    Returns the system prompt for the active rubric, rendered once per rubric version.
     """
-    rubric = load_rubric()
+    return registry.system_prompt()
 
-    if not rubric:
-        return "Error: Rubric not found."
 
-    rubric_text = "\n".join(
-        [f"- **{criterion}**: {description}" 
-         for criterion, description in zip(rubric["Criteria"], rubric["Description"])]
-    )
+def get_criteria():
+    """
+    Returns the score field keys of the active rubric's criteria, e.g. `task_response`.
+    """
+    return registry.criteria()
 
-    band_scores_text = "\n".join(
-        [f"**{band}**: " + ", ".join(
-            [f"{criterion}: {score}" for criterion, score in zip(rubric["Criteria"], rubric[band])]
-        ) for band in ["Band 9", "Band 7", "Band 5", "Band 3"]]
-    )
 
-    rubric_ielts= f"""
-    You are an expert examiner evaluating writing responses based on the following rubric:
-
-    ### **Evaluation Criteria**
-    {rubric_text}
-
-    ### **Band Descriptors**
-    {band_scores_text}
-
-    Your task:
-    - Identify the topic/question in the response.
-    - Score the essay based on the rubric.
-    - Provide structured feedback for each criterion.
-    - Give actionable improvement suggestions.
-
-    Return your response in the following structured JSON format:
-    ```json
-    {{
-      "topic": "Extracted or generated topic",
-      "word_count": 250,
-      "scores": {{
-        "task_response": 7.0,
-        "coherence_and_cohesion": 6.5,
-        "lexical_resource": 7.5,
-        "grammatical_range_and_accuracy": 6.0,
-        "overall_band": 7.0
-      }},
-      "feedback": {{
-        "task_response": "Your response is strong but could benefit from more specific examples.",
-        "coherence_and_cohesion": "Logical flow is clear, but transitions could be smoother.",
-        "lexical_resource": "Good vocabulary variety, though some word choices feel repetitive.",
-        "grammatical_range_and_accuracy": "Grammar is mostly accurate, but complex sentence structures need refining."
-      }},
-      "suggestions": [
-        "Use more varied linking words to improve cohesion.",
-        "Provide deeper analysis to support key arguments.",
-        "Work on sentence variety to enhance fluency."
-      ],
-      "original_essay": "The full essay text"
-    }}
-    ```
+def generate_criterion_prompt(key):
+    """
+    Returns a system prompt covering only one criterion's rubric slice, rendered once per rubric version.
     """
-    # print(rubric_ielts)
-    return rubric_ielts
-# generate_system_prompt()
\ No newline at end of file
+    return registry.criterion_prompt(key)
@@ -0,0 +1,39 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one underlying call.
+
+    The first caller for a key starts `make_call()` as a task; callers arriving
+    while it runs await the same task and receive the same result or
+    exception. Each caller waits through `asyncio.shield`, so a disconnecting
+    client only cancels its own wait. The shared call keeps running even when
+    every waiter has gone, so its result still reaches the cache and a retry
+    of the same request can pick it up.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.counters = {"calls": 0, "coalesced": 0}
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved when nobody is left waiting
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, make_call):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(make_call())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+            self.counters["calls"] += 1
+        else:
+            self.counters["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {**self.counters, "in_flight": len(self._calls)}
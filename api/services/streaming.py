@@ -0,0 +1,58 @@
+from .fast_json import dumps
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def ndjson_line(event: dict) -> bytes:
+    """Encodes one streaming event as a newline-terminated JSON line."""
+    return dumps(event) + b"\n"
+
+
+def _settled_leaves(value, path, settled):
+    """
+    Yields (path, value) for the leaves of a partially parsed JSON document
+    whose values can no longer change.
+
+    A value is settled once something after it has been parsed: a later key in
+    the same object, a later item in the same list, or anything after the
+    enclosing container. Partial numbers such as `6.` never leak this way.
+    """
+    if isinstance(value, dict):
+        keys = list(value)
+        for i, key in enumerate(keys):
+            yield from _settled_leaves(value[key], path + (key,), settled or i < len(keys) - 1)
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield from _settled_leaves(item, path + (i,), settled or i < len(value) - 1)
+    elif settled:
+        yield path, value
+
+
+class PartialFieldTracker:
+    """
+    Turns successive partial snapshots of a structured completion into
+    `field` events, each emitted exactly once as soon as it is settled.
+    """
+
+    def __init__(self, skip=()):
+        self._seen = set()
+        self._skip = set(skip)
+
+    def _events(self, snapshot, final):
+        if not isinstance(snapshot, dict):
+            return []
+        events = []
+        for path, value in _settled_leaves(snapshot, (), final):
+            if path in self._seen or path[0] in self._skip:
+                continue
+            self._seen.add(path)
+            events.append({"type": "field", "path": ".".join(str(p) for p in path), "value": value})
+        return events
+
+    def update(self, snapshot):
+        """Events for fields settled in this partial snapshot."""
+        return self._events(snapshot, False)
+
+    def finish(self, snapshot):
+        """Events for every remaining field once the document is complete."""
+        return self._events(snapshot, True)
@@ -0,0 +1,212 @@
+"""
+Local token accounting for upstream calls.
+
+Every call's prompt is counted before it is sent, split into parts
+(system prompt, user input, images, response schema), and the counts feed
+both admission control and the `ielts_estimated_tokens` metric. Counting
+uses tiktoken when its encodings are available, and a ~4 characters per
+token estimate otherwise. The app loads the encodings in a background
+thread at startup (`preload_encodings`), so no request waits for them. The helpers here also size
+`max_tokens` from the expected output and reject essays too long to score.
+"""
+import base64
+import binascii
+import json
+import math
+import struct
+import threading
+
+from .env import env_int
+from .metrics import estimated_tokens
+from .payload_log import logger
+
+# Rough cost of one image part when its size can't be read
+IMAGE_TOKENS = 765
+DEFAULT_OUTPUT_TOKENS = 800
+# Chat format overhead per message, and for priming the reply
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+# Expected completion sizes. A full evaluation is feedback and suggestions
+# plus the essay itself, which the model echoes back in `original_essay`.
+EVALUATION_OUTPUT_TOKENS = 900
+CRITERION_OUTPUT_TOKENS = 400
+TRANSCRIPT_OUTPUT_TOKENS = 1200
+OUTPUT_MARGIN = 1.25
+
+DEFAULT_MAX_ESSAY_TOKENS = 4000
+
+_encodings = {}
+_preload = None
+_schema_tokens = {}
+
+
+class InputTooLargeError(ValueError):
+    """Raised when an essay exceeds MAX_ESSAY_TOKENS, before any upstream call."""
+
+
+def _load_encoding(model):
+    try:
+        import tiktoken
+    except ImportError:  # optional: fall back to the character estimate
+        _encodings[model] = None
+        return None
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # The BPE files are downloaded on first use and may be unreachable
+        logger.warning("No tiktoken encoding for %s, estimating tokens from characters: %s", model, e)
+        encoding = None
+    _encodings[model] = encoding
+    return encoding
+
+
+def _encoding(model):
+    if model in _encodings:
+        return _encodings[model]
+    if _preload is not None and _preload.is_alive():
+        # Requests don't wait for the BPE files; they are estimated until the preload finishes
+        return None
+    return _load_encoding(model)
+
+
+def load_encodings(models):
+    """Loads (and may download) the encodings for `models`. Blocking; run it off the event loop."""
+    for model in models:
+        if model not in _encodings:
+            _load_encoding(model)
+
+
+def preload_encodings(models):
+    """Starts loading the encodings for `models` in a background thread, once per process."""
+    global _preload
+    if _preload is None:
+        _preload = threading.Thread(target=load_encodings, args=(tuple(models),), name="tiktoken-preload", daemon=True)
+        _preload.start()
+    return _preload
+
+
+def count_tokens(text: str, model: str = "") -> int:
+    """Tokens in `text` for `model`."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def image_tokens(width, height) -> int:
+    """
+    Tokens for a high-detail image: fitted within 2048x2048, scaled so the
+    short side is at most 768px, then billed per 512px tile.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+    return 85 + 170 * tiles
+
+
+def _image_size(url: str):
+    """(width, height) read from the header of a base64 JPEG/PNG data URL, or None."""
+    if not url.startswith("data:"):
+        return None
+    start = url.find("base64,")
+    if start < 0:
+        return None
+    try:
+        head = base64.b64decode(url[start + 7:start + 7 + 8192])
+    except (binascii.Error, ValueError):
+        return None
+    if head.startswith(b"\x89PNG") and len(head) >= 24:
+        return struct.unpack(">II", head[16:24])
+    if head.startswith(b"\xff\xd8"):
+        i = 2
+        while i + 9 <= len(head) and head[i] == 0xFF:
+            marker, length = head[i + 1], struct.unpack(">H", head[i + 2:i + 4])[0]
+            # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", head[i + 5:i + 9])
+                return width, height
+            i += 2 + length
+    return None
+
+
+def _part_tokens(part, model):
+    if part.get("type") == "text":
+        return "input", count_tokens(part.get("text", ""), model)
+    image_url = part.get("image_url", {})
+    if image_url.get("detail") == "low":
+        return "image", 85
+    size = _image_size(image_url.get("url", ""))
+    return "image", image_tokens(*size) if size else IMAGE_TOKENS
+
+
+def schema_tokens(response_format, model: str = "") -> int:
+    """Tokens of a pydantic `response_format`'s JSON schema, which the provider adds to the prompt."""
+    if response_format is None or not hasattr(response_format, "model_json_schema"):
+        return 0
+    key = (response_format, model)
+    if key in _schema_tokens:
+        return _schema_tokens[key]
+    schema = json.dumps(response_format.model_json_schema(), separators=(",", ":"))
+    tokens = count_tokens(schema, model)
+    if model in _encodings:
+        # Not while the encoding is still loading, or the estimate would stick
+        _schema_tokens[key] = tokens
+    return tokens
+
+
+def prompt_tokens(messages, model: str = "", response_format=None):
+    """Estimated prompt tokens of a chat call, by part: system, input, image and schema."""
+    parts = {"system": 0, "input": 0, "image": 0, "schema": schema_tokens(response_format, model)}
+    for message in messages:
+        content = message.get("content")
+        role = "system" if message.get("role") in ("system", "developer") else "input"
+        if isinstance(content, str):
+            parts[role] += count_tokens(content, model)
+        elif isinstance(content, list):
+            for part in content:
+                kind, tokens = _part_tokens(part, model)
+                parts["system" if role == "system" and kind == "input" else kind] += tokens
+        parts[role] += MESSAGE_OVERHEAD
+    parts["input"] += REPLY_OVERHEAD
+    return parts
+
+
+def plan_call(stage, kwargs) -> int:
+    """
+    Counts the prompt of one chat call (the `parse`/`stream` kwargs), records
+    the estimate by part, and returns prompt plus completion tokens for
+    admission. The completion counts at `max_tokens`, when set.
+    """
+    model = kwargs.get("model", "")
+    parts = prompt_tokens(kwargs.get("messages", ()), model, kwargs.get("response_format"))
+    output = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or DEFAULT_OUTPUT_TOKENS
+    for part, tokens in parts.items():
+        if tokens:
+            estimated_tokens.observe(tokens, stage=stage, part=part)
+    estimated_tokens.observe(output, stage=stage, part="max_output")
+    return sum(parts.values()) + output
+
+
+def output_tokens(base, echoed_text="", model=""):
+    """`max_tokens` for a completion of about `base` tokens plus `echoed_text` repeated back, with a margin."""
+    return int((base + (count_tokens(echoed_text, model) if echoed_text else 0)) * OUTPUT_MARGIN)
+
+
+def max_essay_tokens() -> int:
+    return env_int("MAX_ESSAY_TOKENS", DEFAULT_MAX_ESSAY_TOKENS)
+
+
+def check_essay(essay_text: str, model: str = "") -> int:
+    """Returns the essay's token count, raising InputTooLargeError above MAX_ESSAY_TOKENS."""
+    tokens = count_tokens(essay_text, model)
+    limit = max_essay_tokens()
+    if limit and tokens > limit:
+        raise InputTooLargeError(
+            f"The essay is too long to evaluate ({tokens} tokens, the limit is {limit})."
+        )
+    return tokens
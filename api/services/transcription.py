@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+from pydantic import BaseModel
+
+from .evaluation_cache import get_cache, make_digest_key
+from .openai_client import circuit_is_open, parse_completion
+from .payload_log import logger
+from .single_flight import SingleFlight
+from .token_budget import TRANSCRIPT_OUTPUT_TOKENS, output_tokens
+
+# Bump when TRANSCRIPTION_PROMPT changes; transcripts don't depend on the rubric,
+# so rubric updates re-score cached transcripts without another vision call.
+TRANSCRIPTION_VERSION = "1"
+
+TRANSCRIPTION_PROMPT = """You transcribe handwritten or printed IELTS Writing Task 2 pages.
+
+Return JSON with:
+- `topic`: the task question exactly as written on the page, or an empty string if the page has none.
+- `essay`: the essay text exactly as written, without corrections. Keep paragraph breaks as blank lines. If the page holds only part of an essay, transcribe the visible part.
+
+Do not evaluate, summarise or comment on the essay."""
+
+transcription_flights = SingleFlight()
+
+
+class EssayTranscription(BaseModel):
+    topic: str
+    essay: str
+
+
+def transcription_messages(image_url: str):
+    """Chat messages for transcribing one page image (a data URL)."""
+    return [
+        {"role": "system", "content": TRANSCRIPTION_PROMPT},
+        {"role": "user", "content": [
+            {"type": "image_url", "image_url": {"url": image_url}},
+        ]},
+    ]
+
+
+async def transcribe_image(image, model: str) -> EssayTranscription:
+    """
+    Transcribes the topic and essay from one ingested image, cached by the
+    hash of the uploaded bytes.
+    """
+    cache = get_cache()
+    cache_key = make_digest_key("transcript", image.digest, model, TRANSCRIPTION_VERSION)
+    cached = await cache.get(cache_key, allow_stale=circuit_is_open(model))
+    if cached is not None:
+        return EssayTranscription.model_validate_json(cached)
+    # The same page uploaded concurrently is transcribed once
+    return await transcription_flights.do(cache_key, lambda: _transcribe(image, model, cache_key))
+
+
+async def _transcribe(image, model, cache_key):
+    cache = get_cache()
+    start_time = time.time()
+    completion = await parse_completion(
+        stage="transcribe",
+        model=model,
+        messages=transcription_messages(image.data_url()),
+        response_format=EssayTranscription,
+        max_tokens=output_tokens(TRANSCRIPT_OUTPUT_TOKENS),
+    )
+    transcript = completion.choices[0].message.parsed
+    if transcript is None:
+        raise ValueError("The model returned no transcription.")
+    if transcript.essay.strip():
+        await cache.set(cache_key, transcript.model_dump_json())
+    logger.info("Image Transcription Time: %.2f seconds", time.time() - start_time)
+    return transcript
+
+
+def transcript_topic(transcripts) -> str:
+    """The first topic found on the pages, or an empty string."""
+    return next((t.topic.strip() for t in transcripts if t.topic.strip()), "")
+
+
+def stitch_transcripts(transcripts) -> str:
+    """
+    Joins page transcripts in upload order into one "topic + essay" text:
+    the first topic found, then each page's essay text.
+    """
+    topic = transcript_topic(transcripts)
+    pages = [t.essay.strip() for t in transcripts if t.essay.strip()]
+    essay = "\n\n".join(pages)
+    return f"{topic}\n\n{essay}" if topic else essay
+
+
+async def transcribe_pages(images, model: str):
+    """Transcribes every page concurrently; returns the transcripts in upload order."""
+    return await asyncio.gather(*[transcribe_image(image, model) for image in images])
@@ -0,0 +1,43 @@
+"""
+Size-limited reads of multipart uploads.
+
+Uploads are read in chunks and rejected as soon as they pass their limit, so
+an oversized file is never held in memory in full. Each upload kind raises
+its own subclass of UploadTooLargeError, which the API maps to 413.
+"""
+READ_CHUNK_SIZE = 1024 * 1024
+MB = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds its size limit."""
+
+
+def describe_size(limit: int) -> str:
+    return f"{limit // MB} MB" if limit >= MB and limit % MB == 0 else f"{limit} bytes"
+
+
+async def read_limited(file, limit: int, error=UploadTooLargeError, digest=None) -> bytes:
+    """
+    Reads an UploadFile in chunks, raising `error` as soon as it exceeds
+    `limit` bytes. Each chunk is also fed to `digest` (a hashlib object) when
+    one is given.
+    """
+    message = f"{file.filename or 'Upload'} is larger than {describe_size(limit)}."
+    if file.size is not None and file.size > limit:
+        raise error(message)
+
+    await file.seek(0)
+    chunks = []
+    total = 0
+    while True:
+        chunk = await file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > limit:
+            raise error(message)
+        if digest is not None:
+            digest.update(chunk)
+        chunks.append(chunk)
+    return chunks[0] if len(chunks) == 1 else b"".join(chunks)
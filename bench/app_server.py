@@ -0,0 +1,98 @@
+"""
+Runs the FastAPI app for benchmarking, with an event-loop lag monitor and a
+`/__bench/stats` endpoint reporting lag, peak RSS and CPU time.
+
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 python -m bench.app_server --port 8901
+"""
+import argparse
+import asyncio
+import resource
+import time
+
+LAG_INTERVAL = 0.01
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic timer fires on the event loop."""
+
+    def __init__(self, interval=LAG_INTERVAL):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+            if len(self.samples) > 200_000:
+                del self.samples[:100_000]
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def reset(self):
+        self.samples = []
+
+    def summary(self):
+        if not self.samples:
+            return {"max": 0.0, "p99": 0.0, "mean": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "max": round(ordered[-1] * 1000, 3),
+            "p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+            "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+        }
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def instrument(app):
+    """Adds the lag monitor and the stats/reset endpoints to `app`."""
+    monitor = LoopLagMonitor()
+    marks = {"cpu": _cpu_seconds(), "time": time.time()}
+
+    async def start_monitor():
+        monitor.start()
+
+    app.router.on_startup.append(start_monitor)
+
+    @app.get("/__bench/stats")
+    async def bench_stats():
+        return {
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "cpu_seconds": round(_cpu_seconds() - marks["cpu"], 4),
+            "wall_seconds": round(time.time() - marks["time"], 4),
+            "loop_lag_ms": monitor.summary(),
+        }
+
+    @app.post("/__bench/reset")
+    async def bench_reset():
+        monitor.reset()
+        marks["cpu"] = _cpu_seconds()
+        marks["time"] = time.time()
+        return {"ok": True}
+
+    return app
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the IELTS API with benchmark instrumentation.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    args = parser.parse_args(argv)
+
+    from api.index import app
+
+    uvicorn.run(instrument(app), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
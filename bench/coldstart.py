@@ -0,0 +1,157 @@
+"""
+Cold-start profile for the API.
+
+Imports `api.index` in fresh interpreters under `python -X importtime` and
+reports the median import time, the slowest modules, and whether modules
+that should load lazily (the OpenAI SDK, httpx, Pillow, tiktoken) were imported.
+It also starts the app server and times the first response. Exits non-zero
+when a budget is exceeded, so it can gate CI:
+
+    python -m bench.coldstart --runs 5 --max-import-ms 600 --output bench_results/coldstart.json
+    python -m bench.coldstart --compare bench_results/coldstart.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench.run import ROOT, _free_port, _git_revision, stop_servers
+
+DEFAULT_LAZY_MODULES = ("openai", "httpx", "PIL", "tiktoken")
+
+
+def _parse_importtime(stderr):
+    """Yields (module, self_us, cumulative_us) from `-X importtime` output."""
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        yield name.strip(), int(self_us), int(cumulative_us)
+
+
+def import_profile(module, runs, lazy_modules):
+    totals = []
+    cumulative = {}
+    loaded = set()
+    check = "import sys; import {0}; print(' '.join(m for m in {1!r} if m in sys.modules))"
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", check.format(module, tuple(lazy_modules))],
+            cwd=ROOT, capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        )
+        if result.returncode != 0:
+            raise SystemExit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+        loaded.update(result.stdout.split())
+        for name, _, cumulative_us in _parse_importtime(result.stderr):
+            cumulative.setdefault(name, []).append(cumulative_us)
+            if name == module:
+                totals.append(cumulative_us / 1000)
+    # Top-level packages only, by median cumulative time
+    top = sorted(
+        ((name, statistics.median(values) / 1000) for name, values in cumulative.items() if "." not in name),
+        key=lambda item: item[1], reverse=True,
+    )[:10]
+    return {
+        "import_ms": round(statistics.median(totals), 1),
+        "import_ms_min": round(min(totals), 1),
+        "slowest": [{"module": name, "ms": round(ms, 1)} for name, ms in top],
+        "eagerly_loaded": sorted(loaded),
+    }
+
+
+def first_response(runs, path="/api/py/helloFastApi"):
+    """Median milliseconds from starting the app server to its first successful response."""
+    samples = []
+    for _ in range(runs):
+        port = _free_port()
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "bench.app_server", "--port", str(port)],
+            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                if process.poll() is not None:
+                    raise SystemExit("The app server exited during start-up")
+                try:
+                    if httpx.get(f"http://127.0.0.1:{port}{path}", timeout=1.0).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.perf_counter() - start > 30:
+                    raise SystemExit("The app server did not answer within 30 seconds")
+                time.sleep(0.01)
+            samples.append(time.perf_counter() - start)
+        finally:
+            stop_servers([process])
+    return round(statistics.median(samples) * 1000, 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="api.index", help="Module to import")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--lazy", action="append", help="Module that must not load at import (repeatable)")
+    parser.add_argument("--max-import-ms", type=float, help="Fail when the median import time exceeds this")
+    parser.add_argument("--max-first-response-ms", type=float, help="Fail when the first response takes longer")
+    parser.add_argument("--skip-server", action="store_true", help="Only profile the import")
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    parser.add_argument("--compare", help="Earlier report to compare against")
+    args = parser.parse_args(argv)
+
+    lazy_modules = args.lazy or list(DEFAULT_LAZY_MODULES)
+    report = {"revision": _git_revision(), "module": args.module, "runs": args.runs}
+    report.update(import_profile(args.module, args.runs, lazy_modules))
+    if not args.skip_server:
+        report["first_response_ms"] = first_response(args.runs)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    def line(label, key):
+        value = report.get(key)
+        if value is None:
+            return
+        text = f"{label:<22}{value:>10.1f} ms"
+        if baseline and baseline.get(key):
+            text += f"  ({(value - baseline[key]) / baseline[key] * 100:+.0f}% vs {baseline[key]:.1f})"
+        print(text)
+
+    line(f"import {args.module}", "import_ms")
+    line("first response", "first_response_ms")
+    print("slowest top-level imports:")
+    for entry in report["slowest"]:
+        print(f"  {entry['module']:<30}{entry['ms']:>10.1f} ms")
+    if report["eagerly_loaded"]:
+        print("loaded at import but expected lazily: " + ", ".join(report["eagerly_loaded"]))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    failures = []
+    if report["eagerly_loaded"]:
+        failures.append("lazy modules imported eagerly")
+    if args.max_import_ms and report["import_ms"] > args.max_import_ms:
+        failures.append(f"import took {report['import_ms']} ms (budget {args.max_import_ms} ms)")
+    if args.max_first_response_ms and report.get("first_response_ms", 0) > args.max_first_response_ms:
+        failures.append(
+            f"first response took {report['first_response_ms']} ms (budget {args.max_first_response_ms} ms)"
+        )
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
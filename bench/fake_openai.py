@@ -0,0 +1,259 @@
+"""
+Local stand-in for the OpenAI chat-completions API, used by the benchmark.
+
+Answers `POST /v1/chat/completions` (plain, structured-output and streaming)
+with schema-conforming JSON after a configurable delay. Structured outputs
+are generated from the `json_schema` the client sends, so any pydantic
+response_format works.
+
+    python -m bench.fake_openai --port 8900 --latency 2.0 --jitter 0.5 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "education technology society government individuals should however therefore "
+    "although many people believe that argue important benefits drawbacks example "
+    "furthermore consequently children environment modern countries opinion"
+).split()
+BANDS = [5.0, 5.5, 6.0, 6.5, 7.0, 7.5, 8.0]
+# Sentence templates for essay text: ordinary English prose, so transcripts
+# pass the app's pre-screen the way real ones would
+ESSAY_TEMPLATES = (
+    "Many people believe that {} is more important than {} in the modern world.",
+    "However, it could be argued that {} has a strong effect on {} as well.",
+    "For example, in some countries {} is seen as a way to improve {}.",
+    "This is because {} and {} are closely connected in our daily lives.",
+    "In my opinion, the government should pay more attention to {} than to {}.",
+    "On the other hand, {} may also bring some drawbacks for {}.",
+)
+
+
+class FakeConfig:
+    def __init__(self, latency=1.0, jitter=0.2, error_rate=0.0, error_status=500,
+                 response_words=60, ttft_fraction=0.15, chunk_chars=24):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.response_words = response_words
+        self.ttft_fraction = ttft_fraction
+        self.chunk_chars = chunk_chars
+
+    def delay(self):
+        return max(0.0, random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+
+
+def _text(words):
+    return " ".join(random.choice(WORDS) for _ in range(max(1, words)))
+
+
+def _essay(words, paragraphs=4):
+    sentences = []
+    while sum(len(s.split()) for s in sentences) < words:
+        sentences.append(random.choice(ESSAY_TEMPLATES).format(_text(2), _text(2)))
+    size = max(1, -(-len(sentences) // paragraphs))
+    return "\n\n".join(" ".join(sentences[i:i + size]) for i in range(0, len(sentences), size))
+
+
+def _resolve(schema, root):
+    ref = schema.get("$ref")
+    if ref:
+        node = root
+        for part in ref.lstrip("#/").split("/"):
+            node = node[part]
+        return _resolve(node, root)
+    return schema
+
+
+def fake_value(schema, root, words, name=""):
+    """Builds a value conforming to a (strict) JSON schema."""
+    schema = _resolve(schema, root)
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            # Optional fields (e.g. `error`) are left unset, as a real model would
+            options = [s for s in schema[key] if _resolve(s, root).get("type") != "null"]
+            if len(options) < len(schema[key]) or not options:
+                return None
+            return fake_value(options[0], root, words, name)
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "null")
+    if "enum" in schema:
+        return schema["enum"][0]
+    if kind == "object":
+        return {
+            key: fake_value(sub, root, words, key)
+            for key, sub in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        return [fake_value(schema.get("items", {}), root, max(4, words // 4), name) for _ in range(3)]
+    if kind == "number":
+        return random.choice(BANDS)
+    if kind == "integer":
+        return 250
+    if kind == "boolean":
+        return True
+    if kind == "null":
+        return None
+    if name in ("essay", "original_essay"):
+        return _essay(words * 4)
+    if name == "topic":
+        return _text(12)
+    return _text(words)
+
+
+def completion_content(body, config):
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"]["schema"]
+        return json.dumps(fake_value(schema, schema, config.response_words))
+    if response_format.get("type") == "json_object":
+        return json.dumps({"result": _text(config.response_words)})
+    return _text(config.response_words)
+
+
+def _usage(body, content):
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+RATE_LIMIT_HEADERS = {
+    "x-ratelimit-limit-requests": "10000",
+    "x-ratelimit-remaining-requests": "9999",
+    "x-ratelimit-limit-tokens": "30000000",
+    "x-ratelimit-remaining-tokens": "29990000",
+    "x-ratelimit-reset-requests": "6ms",
+    "x-ratelimit-reset-tokens": "0s",
+}
+
+
+def create_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    app.state.counters = {"requests": 0, "errors": 0, "streams": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.counters["requests"] += 1
+        delay = config.delay()
+
+        if config.error_rate and random.random() < config.error_rate:
+            await asyncio.sleep(delay * config.ttft_fraction)
+            app.state.counters["errors"] += 1
+            headers = {"retry-after": "1"} if config.error_status == 429 else {}
+            return JSONResponse(
+                status_code=config.error_status,
+                content={"error": {"message": "Injected failure", "type": "server_error", "code": None}},
+                headers=headers,
+            )
+
+        content = completion_content(body, config)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        model = body.get("model", "fake-model")
+        usage = _usage(body, content)
+
+        if body.get("stream"):
+            app.state.counters["streams"] += 1
+            return StreamingResponse(
+                _stream(completion_id, created, model, content, usage, body, delay, config),
+                media_type="text/event-stream",
+                headers=RATE_LIMIT_HEADERS,
+            )
+
+        await asyncio.sleep(delay)
+        return JSONResponse(
+            content={
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content, "refusal": None},
+                    "logprobs": None,
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            },
+            headers=RATE_LIMIT_HEADERS,
+        )
+
+    @app.get("/__fake/stats")
+    async def stats():
+        return app.state.counters
+
+    return app
+
+
+async def _stream(completion_id, created, model, content, usage, body, delay, config):
+    def chunk(delta, finish_reason=None, chunk_usage=None):
+        data = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}]
+            if chunk_usage is None else [],
+        }
+        if chunk_usage is not None:
+            data["usage"] = chunk_usage
+        return f"data: {json.dumps(data)}\n\n"
+
+    await asyncio.sleep(delay * config.ttft_fraction)
+    yield chunk({"role": "assistant", "content": ""})
+    pieces = [content[i:i + config.chunk_chars] for i in range(0, len(content), config.chunk_chars)]
+    gap = delay * (1 - config.ttft_fraction) / max(1, len(pieces))
+    for piece in pieces:
+        await asyncio.sleep(gap)
+        yield chunk({"content": piece})
+    yield chunk({}, finish_reason="stop")
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield chunk({}, chunk_usage=usage)
+    yield "data: [DONE]\n\n"
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=1.0, help="Mean upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency standard deviation in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected failures")
+    parser.add_argument("--response-words", type=int, default=60, help="Words per generated string field")
+
+
+def config_from_args(args) -> FakeConfig:
+    return FakeConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        response_words=args.response_words,
+    )
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI chat-completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
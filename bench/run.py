@@ -0,0 +1,337 @@
+"""
+Load test for the IELTS API against a local fake OpenAI server.
+
+Starts `bench.fake_openai` and `bench.app_server` as subprocesses, replays a
+workload at each concurrency level and reports latency percentiles,
+throughput, peak RSS, CPU time per request and event-loop lag. Results are
+written as JSON so runs can be compared:
+
+    python -m bench.run --workload text --workload image --concurrency 1,8,32 \\
+        --requests 64 --latency 2 --output bench_results/base.json
+    python -m bench.run ... --compare bench_results/base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import time
+import zlib
+
+import httpx
+
+from bench.fake_openai import add_arguments as add_fake_arguments
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKLOADS = {
+    # name: endpoint
+    "text": "/api/py/evaluate",
+    "cached": "/api/py/evaluate",
+    "replay": "/api/py/evaluate",
+    "image": "/api/py/evaluate",
+    "multi": "/api/py/evaluate-multi",
+}
+
+# Sentence templates and subjects; every generated sentence is distinct, so
+# the essays pass the pre-screen's repeated-text check
+ESSAY_SENTENCES = [
+    "Some people believe that {} has made our lives more complicated.",
+    "In my opinion, the advantages of {} clearly outweigh the drawbacks.",
+    "Firstly, governments should invest more in {}.",
+    "For example, many families in rural areas still lack access to {}.",
+    "Furthermore, individuals must take responsibility for how they use {}.",
+    "However, it could be argued that {} matters less than personal freedom.",
+    "Consequently, a balanced approach to {} is required.",
+    "In conclusion, the debate about {} has merit on both sides, but I support the former view.",
+]
+ESSAY_SUBJECTS = [
+    "technology", "public education", "online shopping", "social media", "public transport",
+    "renewable energy", "modern medicine", "international travel",
+]
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def synthetic_essay(seed, paragraphs=4, sentences=5):
+    rng = random.Random(seed)
+    pairs = rng.sample([(t, s) for t in ESSAY_SENTENCES for s in ESSAY_SUBJECTS], paragraphs * sentences)
+    lines = [template.format(subject) for template, subject in pairs]
+    body = "\n\n".join(" ".join(lines[i:i + sentences]) for i in range(0, len(lines), sentences))
+    return f"Essay {seed}: Some people think technology does more harm than good. Discuss.\n\n{body}"
+
+
+def synthetic_page_png(seed, width=1000, height=1400):
+    """A grayscale PNG that looks roughly like a page of handwriting."""
+    rng = random.Random(seed)
+    blank = b"\x00" + b"\xff" * width
+    rows = []
+    for y in range(height):
+        if 80 < y < height - 80 and (y // 14) % 3 == 0:
+            rows.append(b"\x00" + bytes(rng.choice((0, 40, 255, 255, 255)) for _ in range(width)))
+        else:
+            rows.append(blank)
+    raw = b"".join(rows)
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+def build_requests(workload, total, args):
+    """Pre-builds (path, httpx kwargs) for every request so generation isn't timed."""
+    path = WORKLOADS[workload]
+    if workload == "text":
+        return [(path, {"data": {"essay_text": synthetic_essay(i)}}) for i in range(total)]
+    if workload == "cached":
+        # A handful of essays over and over: after the warm-up nearly every request is a cache hit
+        return [(path, {"data": {"essay_text": synthetic_essay(i % 8)}}) for i in range(total)]
+    if workload == "replay":
+        from api.services.batch_runner import parse_batch_lines
+
+        with open(args.replay_file, encoding="utf-8") as f:
+            items = [item for item in parse_batch_lines(f.read().splitlines()) if "essay_text" in item]
+        if not items:
+            raise SystemExit(f"No essays found in {args.replay_file}")
+        return [(path, {"data": {"essay_text": items[i % len(items)]["essay_text"]}}) for i in range(total)]
+    if workload == "image":
+        return [(path, {"files": {"file": (f"page{i}.png", synthetic_page_png(i), "image/png")}})
+                for i in range(total)]
+    if workload == "multi":
+        return [
+            (path, {"files": [
+                ("files", (f"page{i}-{k}.png", synthetic_page_png(i * 100 + k), "image/png"))
+                for k in range(args.pages)
+            ]})
+            for i in range(total)
+        ]
+    raise SystemExit(f"Unknown workload {workload}")
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+async def run_level(base_url, requests, concurrency):
+    timeout = httpx.Timeout(600.0, connect=10.0)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        await client.post("/__bench/reset")
+        latencies = []
+        statuses = {}
+        pending = iter(requests)
+
+        async def worker():
+            for path, kwargs in pending:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, **kwargs)
+                    await response.aread()
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        app_stats = (await client.get("/__bench/stats")).json()
+
+    ordered = sorted(latencies)
+    ok = statuses.get("200", 0)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(latencies) - ok,
+        "statuses": statuses,
+        "elapsed_seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ordered, 0.50) * 1000, 1),
+            "p95": round(percentile(ordered, 0.95) * 1000, 1),
+            "p99": round(percentile(ordered, 0.99) * 1000, 1),
+            "mean": round(sum(ordered) / len(ordered) * 1000, 1) if ordered else 0.0,
+            "max": round(ordered[-1] * 1000, 1) if ordered else 0.0,
+        },
+        "peak_rss_mb": app_stats["peak_rss_mb"],
+        "cpu_ms_per_request": round(app_stats["cpu_seconds"] * 1000 / max(1, len(latencies)), 3),
+        "loop_lag_ms": app_stats["loop_lag_ms"],
+    }
+
+
+def _wait_ready(url, process, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Process serving {url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+def start_servers(args):
+    fake_port, app_port = _free_port(), _free_port()
+    log = open(os.devnull, "w") if not args.server_log else open(args.server_log, "a")
+    fake = subprocess.Popen(
+        [sys.executable, "-m", "bench.fake_openai", "--port", str(fake_port),
+         "--latency", str(args.latency), "--jitter", str(args.jitter),
+         "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+         "--response-words", str(args.response_words)],
+        cwd=ROOT, stdout=log, stderr=log,
+    )
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "OPENAI_API_KEY": "bench",
+        "PYTHONUNBUFFERED": "1",
+    })
+    if not args.cache and "cached" not in (args.workload or []):
+        env["EVAL_CACHE_MAX_ENTRIES"] = "0"
+        env.pop("EVAL_CACHE_PATH", None)
+    app = subprocess.Popen(
+        [sys.executable, "-m", "bench.app_server", "--port", str(app_port)],
+        cwd=ROOT, env=env, stdout=log, stderr=log,
+    )
+    try:
+        _wait_ready(f"http://127.0.0.1:{fake_port}/__fake/stats", fake)
+        _wait_ready(f"http://127.0.0.1:{app_port}/__bench/stats", app)
+    except BaseException:
+        stop_servers([fake, app])
+        raise
+    return f"http://127.0.0.1:{app_port}", [fake, app]
+
+
+def stop_servers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_table(results, baseline=None):
+    previous = {}
+    for row in (baseline or {}).get("results", []):
+        previous[(row["workload"], row["concurrency"])] = row
+
+    def delta(new, old):
+        if old in (None, 0):
+            return ""
+        return f" ({(new - old) / old * 100:+.0f}%)"
+
+    header = f"{'workload':<8} {'conc':>5} {'rps':>10} {'p50 ms':>16} {'p95 ms':>16} {'p99 ms':>10} " \
+             f"{'cpu ms/req':>16} {'rss MB':>8} {'lag max ms':>11} {'errors':>7}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        old = previous.get((row["workload"], row["concurrency"]))
+        lat = row["latency_ms"]
+        print(
+            f"{row['workload']:<8} {row['concurrency']:>5} "
+            f"{str(row['rps']) + delta(row['rps'], old and old['rps']):>10} "
+            f"{str(lat['p50']) + delta(lat['p50'], old and old['latency_ms']['p50']):>16} "
+            f"{str(lat['p95']) + delta(lat['p95'], old and old['latency_ms']['p95']):>16} "
+            f"{lat['p99']:>10} "
+            f"{str(row['cpu_ms_per_request']) + delta(row['cpu_ms_per_request'], old and old['cpu_ms_per_request']):>16} "
+            f"{row['peak_rss_mb']:>8} {row['loop_lag_ms']['max']:>11} {row['errors']:>7}"
+        )
+
+
+async def run(args, base_url):
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    results = []
+    for workload in args.workload or ["text"]:
+        requests = build_requests(workload, args.requests, args)
+        if args.warmup:
+            await run_level(base_url, build_requests(workload, args.warmup, args), min(levels))
+        for concurrency in levels:
+            row = await run_level(base_url, requests, concurrency)
+            row["workload"] = workload
+            row["endpoint"] = WORKLOADS[workload]
+            results.append(row)
+            print(f"{workload} @ {concurrency}: {row['rps']} req/s, p95 {row['latency_ms']['p95']} ms",
+                  file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the IELTS API against a fake OpenAI server.")
+    parser.add_argument("--workload", action="append", choices=sorted(WORKLOADS),
+                        help="Workload to run (repeatable, default: text)")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=4, help="Warm-up requests per workload (not reported)")
+    parser.add_argument("--replay-file", default=os.path.join(ROOT, "requests.jsonl"),
+                        help="JSONL file for the replay workload")
+    parser.add_argument("--pages", type=int, default=3, help="Images per request for the multi workload")
+    parser.add_argument("--cache", action="store_true", help="Keep the evaluation cache enabled")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--server-log", help="Append fake server and app output to this file")
+    add_fake_arguments(parser)
+    args = parser.parse_args(argv)
+
+    base_url, processes = start_servers(args)
+    try:
+        results = asyncio.run(run(args, base_url))
+    finally:
+        stop_servers(processes)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "upstream": {
+                "latency": args.latency,
+                "jitter": args.jitter,
+                "error_rate": args.error_rate,
+                "error_status": args.error_status,
+                "response_words": args.response_words,
+            },
+            "requests_per_level": args.requests,
+            "cache": args.cache,
+        },
+        "results": results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from api.services.admission import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    AdmissionController,
+    AdmissionRejectedError,
+    RateBudget,
+    parse_reset,
+)
+
+
+class GateBudget:
+    """A budget that admits nothing while closed and everything once opened."""
+
+    def __init__(self, projected=0.0):
+        self.open = False
+        self.projected = projected
+        self.consumed = 0
+
+    def delay(self, tokens, now=None):
+        return 0.0 if self.open else 0.01
+
+    def consume(self, tokens, now=None):
+        self.consumed += tokens
+
+    def projected_wait(self, requests, tokens):
+        return self.projected
+
+
+def controller(budget, interactive=5.0, batch=30.0):
+    return AdmissionController("test-model", budget, {PRIORITY_INTERACTIVE: interactive, PRIORITY_BATCH: batch})
+
+
+def test_parse_reset():
+    assert parse_reset("6ms") == pytest.approx(0.006)
+    assert parse_reset("1.5s") == 1.5
+    assert parse_reset("1m30s") == 90
+    assert parse_reset("") is None
+    assert parse_reset("soon") is None
+
+
+def test_budget_counts_requests_in_a_sliding_window():
+    budget = RateBudget(rpm=2, headroom=1.0)
+    budget.consume(10, now=100.0)
+    assert budget.delay(10, now=101.0) == 0
+    budget.consume(10, now=101.0)
+    # The third call fits once the first leaves the one-minute window
+    assert budget.delay(10, now=102.0) == pytest.approx(58.0)
+    assert budget.delay(10, now=160.5) == 0
+
+
+def test_budget_counts_tokens_with_headroom():
+    budget = RateBudget(tpm=1000, headroom=0.5)
+    budget.consume(400, now=0.0)
+    assert budget.delay(100, now=1.0) == 0
+    assert budget.delay(200, now=1.0) == pytest.approx(59.0)
+
+
+def test_budget_learns_limits_and_pauses_from_headers():
+    budget = RateBudget()
+    budget.observe_headers({
+        "x-ratelimit-limit-requests": "500",
+        "x-ratelimit-limit-tokens": "30000",
+        "x-ratelimit-remaining-tokens": "0",
+        "x-ratelimit-reset-tokens": "2s",
+    })
+    assert (budget.rpm, budget.tpm) == (500, 30000)
+    assert 1.0 < budget.delay(1) <= 2.0
+
+
+def test_configured_limits_win_over_headers():
+    budget = RateBudget(rpm=10)
+    budget.observe_headers({"x-ratelimit-limit-requests": "500"})
+    assert budget.rpm == 10
+
+
+def test_calls_within_budget_are_admitted_at_once():
+    budget = GateBudget()
+    budget.open = True
+    asyncio.run(controller(budget).admit(100))
+    assert budget.consumed == 100
+
+
+def test_projected_wait_over_the_slo_is_rejected_up_front():
+    budget = GateBudget(projected=60.0)
+    with pytest.raises(AdmissionRejectedError) as info:
+        asyncio.run(controller(budget, interactive=5.0).admit(100))
+    assert info.value.retry_after == 60.0
+    assert budget.consumed == 0
+
+
+def test_waiters_are_served_by_priority_then_round_robin_across_tenants():
+    async def scenario():
+        budget = GateBudget()
+        gate = controller(budget)
+        order = []
+
+        async def call(name, tenant, priority):
+            await gate.admit(1, tenant, priority)
+            order.append(name)
+
+        tasks = []
+        for name, tenant, priority in [
+            ("batch-a", "a", PRIORITY_BATCH),
+            ("a1", "a", PRIORITY_INTERACTIVE),
+            ("a2", "a", PRIORITY_INTERACTIVE),
+            ("b1", "b", PRIORITY_INTERACTIVE),
+        ]:
+            tasks.append(asyncio.ensure_future(call(name, tenant, priority)))
+            await asyncio.sleep(0)
+        assert gate.queued() == 4
+        budget.open = True
+        await asyncio.gather(*tasks)
+        return order, gate.queued()
+
+    order, queued = asyncio.run(scenario())
+    assert order == ["a1", "b1", "a2", "batch-a"]
+    assert queued == 0
+
+
+def test_waiters_past_their_slo_are_rejected_in_the_queue():
+    async def scenario():
+        gate = controller(GateBudget(), interactive=0.05)
+        return await asyncio.gather(gate.admit(1), return_exceptions=True)
+
+    (result,) = asyncio.run(scenario())
+    assert isinstance(result, AdmissionRejectedError)
+
+
+def test_cancelled_waiters_leave_the_queue():
+    async def scenario():
+        gate = controller(GateBudget())
+        task = asyncio.ensure_future(gate.admit(1, "a"))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return gate.queued()
+
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,122 @@
+"""Endpoint behaviour that doesn't need the model provider."""
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api import index
+from api.index import app
+from api.services.openai_client import UpstreamAPIError
+from api.services.transcription import EssayTranscription
+from bench.run import synthetic_essay, synthetic_page_png
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    return TestClient(app)
+
+
+def test_admin_endpoints_are_disabled_without_a_token(client):
+    assert client.delete("/api/py/cache").status_code == 404
+    assert client.post("/api/py/warmup").status_code == 404
+
+
+def test_admin_endpoints_check_the_token(client, monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    assert client.delete("/api/py/cache").status_code == 403
+    assert client.delete("/api/py/cache", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.delete("/api/py/cache", headers={"X-Admin-Token": "secret"}).status_code == 200
+
+
+def test_rejected_essays_never_reach_the_model(client):
+    response = client.post("/api/py/evaluate", data={"essay_text": "Technology is good."})
+    assert response.status_code == 422
+    assert response.json()["reason"] == "too_short"
+    assert response.json()["features"]["word_count"] == 3
+
+
+def test_batch_rejections_are_reported_inline(client):
+    response = client.post("/api/py/evaluate-batch", files={"file": ("essays.jsonl", b'{"id": "1", "essay": "Too short."}')})
+    assert response.status_code == 200
+    assert response.json() == {
+        "id": "1", "status": "error", "reason": "too_short",
+        "error": "The essay is too short to grade (2 words; at least 50 are needed).",
+    }
+
+
+def test_oversized_batch_uploads_are_rejected(client, monkeypatch):
+    monkeypatch.setenv("BATCH_MAX_UPLOAD_BYTES", "100")
+    response = client.post("/api/py/evaluate-batch", files={"file": ("essays.jsonl", b'{"essay": "' + b"x " * 100 + b'"}')})
+    assert response.status_code == 413
+    assert response.json() == {"detail": "essays.jsonl is larger than 100 bytes."}
+
+
+def test_stream_hides_provider_error_bodies(client, monkeypatch):
+    async def failing_stream(**kwargs):
+        raise UpstreamAPIError("Error code: 400 - {'error': 'internal provider detail'}", status_code=400)
+        yield
+
+    monkeypatch.setattr(index, "stream_parsed_completion", failing_stream)
+    response = client.post("/api/py/evaluate-stream", data={"essay_text": synthetic_essay(101)})
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [event["type"] for event in events] == ["screening", "error"]
+    assert events[-1]["detail"] == "The model provider returned an error, please retry."
+
+
+def stream_image(client):
+    files = {"file": ("page.png", synthetic_page_png(1, 300, 400), "image/png")}
+    response = client.post("/api/py/evaluate-stream", files=files)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_image_stream_reports_transcription_failures_as_events(client, monkeypatch):
+    async def failing_transcription(images, model):
+        raise UpstreamAPIError("Error code: 500 - internal provider detail", status_code=500)
+
+    monkeypatch.setattr(index, "transcribe_pages", failing_transcription)
+    events = stream_image(client)
+    assert events == [
+        {"type": "status", "status": "transcribing"},
+        {"type": "error", "detail": "The model provider returned an error, please retry."},
+    ]
+
+
+def test_image_stream_reports_rejected_transcripts(client, monkeypatch):
+    async def transcription(images, model):
+        return [EssayTranscription(topic="Is technology good?", essay="Technology is good.")]
+
+    monkeypatch.setattr(index, "transcribe_pages", transcription)
+    events = stream_image(client)
+    assert events[0] == {"type": "status", "status": "transcribing"}
+    assert events[1]["type"] == "error" and events[1]["reason"] == "too_short"
+    assert len(events) == 2
+
+
+def test_image_stream_sends_the_topic_before_scoring(client, monkeypatch):
+    essay = synthetic_essay(102)
+    topic, body = essay.split("\n\n", 1)
+
+    async def transcription(images, model):
+        return [EssayTranscription(topic=topic, essay=body)]
+
+    async def scoring_stream(**kwargs):
+        scores = dict(task_response=7, coherence_and_cohesion=6.5, lexical_resource=7, grammatical_range_and_accuracy=6)
+        result = index.IELTSWritingEvaluation.from_essay(topic, body, scores, {k: "Fine." for k in scores}, ["More."])
+        yield SimpleNamespace(type="content.done", parsed=result)
+
+    monkeypatch.setattr(index, "transcribe_pages", transcription)
+    monkeypatch.setattr(index, "stream_parsed_completion", scoring_stream)
+    events = stream_image(client)
+    assert events[:3] == [
+        {"type": "status", "status": "transcribing"},
+        {"type": "transcript", "topic": topic},
+        {"type": "screening", **index.screen_essay(essay).to_dict()},
+    ]
+    assert events[-1]["type"] == "result"
+    assert events[-1]["data"]["score"]["overall_band"] == 6.5
+    # The result counts words exactly as the pre-screen did
+    assert events[-1]["data"]["word_count"] == events[2]["features"]["word_count"] == len(body.split())
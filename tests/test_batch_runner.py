@@ -0,0 +1,70 @@
+import asyncio
+import io
+import json
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from api import index
+from api.services.batch_runner import BatchTooLargeError, parse_batch_line, read_batch_upload, run_batch_file
+from bench.run import synthetic_essay
+
+
+class Result:
+    def __init__(self, essay_text):
+        self.essay_text = essay_text
+
+    def model_dump(self):
+        return {"words": len(self.essay_text.split())}
+
+
+def write_lines(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+
+
+def test_parse_batch_line():
+    assert parse_batch_line("  ", 1) is None
+    assert parse_batch_line('{"id": 7, "title": "Topic", "essay": "Body"}', 1) == {"id": "7", "essay_text": "Topic\n\nBody"}
+    assert parse_batch_line('{"essay": "Body"}', 3)["id"] == "line-3"
+    assert "Invalid JSON" in parse_batch_line("{", 2)["error"]
+    assert "Missing essay text" in parse_batch_line('{"id": "a", "essay": " "}', 1)["error"]
+
+
+def test_upload_limit_is_enforced_while_reading():
+    upload = UploadFile(io.BytesIO(b"x" * 100), filename="essays.jsonl")
+    with pytest.raises(BatchTooLargeError, match="essays.jsonl is larger than 99 bytes"):
+        asyncio.run(read_batch_upload(upload, limit=99))
+    assert asyncio.run(read_batch_upload(upload, limit=100)) == b"x" * 100
+
+
+def test_checkpoint_resumes_an_interrupted_run(tmp_path, monkeypatch):
+    calls = []
+
+    async def evaluate(essay_text, screening=None):
+        calls.append(essay_text)
+        if essay_text == failing:
+            raise RuntimeError("upstream failed")
+        return Result(essay_text)
+
+    monkeypatch.setattr(index, "process_ielts_essay", evaluate)
+    essays = [synthetic_essay(seed) for seed in range(4)]
+    failing = essays[3]
+    source, output, checkpoint = tmp_path / "in.jsonl", tmp_path / "out.jsonl", tmp_path / "done"
+    write_lines(source, [{"id": f"e{i}", "essay": essay} for i, essay in enumerate(essays)])
+    checkpoint.write_text("e0\ne1\n", encoding="utf-8")
+
+    counts = asyncio.run(run_batch_file(str(source), str(output), concurrency=2, checkpoint_path=str(checkpoint)))
+
+    assert counts == {"ok": 1, "error": 1}
+    assert sorted(calls) == sorted(essays[2:])
+    records = {record["id"]: record for record in map(json.loads, output.read_text().splitlines())}
+    assert records["e2"]["status"] == "ok"
+    assert records["e3"] == {"id": "e3", "status": "error", "error": "upstream failed"}
+    # Only successes are checkpointed, so the failed item is retried next time
+    assert checkpoint.read_text().split() == ["e0", "e1", "e2"]
+
+    calls.clear()
+    failing = None
+    counts = asyncio.run(run_batch_file(str(source), str(output), concurrency=2, checkpoint_path=str(checkpoint)))
+    assert counts == {"ok": 1, "error": 0}
+    assert calls == [essays[3]]
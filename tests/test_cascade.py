@@ -0,0 +1,83 @@
+import asyncio
+
+from api import index
+from api.services.cascade import RULES, CascadeConfig, CascadeStats, escalation_reasons
+from bench.run import synthetic_essay
+
+CONFIG = CascadeConfig("fast", "strong")
+
+
+def scores_of(*values):
+    return dict(zip(("task_response", "coherence_and_cohesion", "lexical_resource", "grammatical_range_and_accuracy"), values))
+
+
+def test_clear_results_are_accepted():
+    assert escalation_reasons(scores_of(6, 6, 6.5, 6), 6.0, 0.9, CONFIG) == []
+
+
+def test_out_of_range_scores_fail_validation():
+    assert escalation_reasons(scores_of(6, 6, 10, 6), 7.0, 0.9, CONFIG) == ["validation"]
+    assert escalation_reasons(scores_of(6, -1, 6, 6), 4.5, 0.9, CONFIG) == ["validation"]
+
+
+def test_boundary_rule():
+    # Mean 6.25 sits on a rounding threshold
+    assert escalation_reasons(scores_of(6, 6, 6, 7), 6.5, 0.9, CONFIG) == ["boundary"]
+    # Off the half-band scale
+    assert escalation_reasons(scores_of(6.3, 6, 6, 6), 6.0, 0.9, CONFIG) == ["boundary"]
+
+
+def test_inconsistent_rule():
+    assert "inconsistent" in escalation_reasons(scores_of(4, 7, 7, 7), 6.5, 0.9, CONFIG)
+    # The reported overall band doesn't match the criteria
+    assert escalation_reasons(scores_of(6, 6, 6, 6), 7.0, 0.9, CONFIG) == ["inconsistent"]
+
+
+def test_low_confidence_rule():
+    assert escalation_reasons(scores_of(6, 6, 6, 6), 6.0, 0.5, CONFIG) == ["low_confidence"]
+    assert escalation_reasons(scores_of(6, 6, 6, 6), 6.0, None, CONFIG) == []
+
+
+def test_disabled_rules_never_fire():
+    config = CascadeConfig("fast", "strong", rules=("low_confidence",))
+    assert escalation_reasons(scores_of(4, 7, 7, 7), 9.0, 0.9, config) == []
+
+
+def test_rules_are_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("CASCADE_RULES", "boundary, unknown ,low_confidence")
+    monkeypatch.setenv("CASCADE_MIN_CONFIDENCE", "not-a-number")
+    config = CascadeConfig.from_env("gpt-4o")
+    assert config.rules == ("boundary", "low_confidence")
+    assert config.strong_model == "gpt-4o"
+    assert config.min_confidence == 0.7
+
+
+def test_stats():
+    stats = CascadeStats()
+    stats.record_answer("fast", "fast")
+    stats.record_escalation(["boundary", "low_confidence"])
+    stats.record_answer("strong", "strong")
+    stats.record_comparison(6.5, 6.5)
+    stats.record_comparison(6.0, 7.0)
+    summary = stats.stats()
+    assert summary["escalation_rate"] == 0.5
+    assert summary["escalations"] == {rule: int(rule in ("boundary", "low_confidence")) for rule in RULES}
+    assert summary["agreement"] == {"exact": 1, "within_half_band": 0, "disagree": 1}
+    assert summary["agreement_rate"] == 0.5
+    assert summary["mean_abs_band_diff"] == 0.5
+
+
+def test_malformed_audit_rate_falls_back_to_no_audit(monkeypatch):
+    monkeypatch.setenv("CASCADE_AUDIT_RATE", "ten percent")
+    calls = []
+
+    async def score_with(model, messages, response_format, max_tokens=None):
+        calls.append(model)
+        scores = scores_of(6, 6, 6.5, 6)
+        result = index.IELTSWritingEvaluation.from_essay("Topic", "Body.", scores, {k: "" for k in scores}, [])
+        return response_format(**result.model_dump(), confidence=0.9)
+
+    monkeypatch.setattr(index, "_score_with", score_with)
+    result = asyncio.run(index.score_essay_cascade(synthetic_essay(103), "text-cascade:audit-rate"))
+    assert result.score.overall_band == 6.0
+    assert calls == ["gpt-4o-mini"]
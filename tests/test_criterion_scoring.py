@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from api import index
+from api.services.evaluation_cache import get_cache
+from api.services.rubric_evaluator import criterion_key, rubric_data
+
+TOPIC = "Some people think technology does more harm than good. Discuss."
+BODY = "Technology helps people learn.\n\nIt also connects families who live far apart."
+
+SCORES = {"task_response": 7.0, "coherence_and_cohesion": 6.5, "lexical_resource": 7.0, "grammatical_range_and_accuracy": 6.0}
+
+
+def criterion_of(messages):
+    system = messages[0]["content"]
+    return next(criterion_key(name) for name in rubric_data["Criteria"] if f"### **{name}**" in system)
+
+
+def fake_parse_completion(missing=()):
+    async def parse_completion(stage, model, messages, response_format, max_tokens=None):
+        key = criterion_of(messages)
+        parsed = None
+        if key not in missing:
+            values = dict(score=SCORES[key], feedback=f"{key} feedback", suggestions=[f"{key} suggestion"])
+            if key == "task_response":
+                values["topic"] = TOPIC
+            parsed = response_format(**values)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(parsed=parsed))])
+
+    return parse_completion
+
+
+def test_criterion_results_are_merged_through_from_essay(monkeypatch):
+    monkeypatch.setattr(index, "parse_completion", fake_parse_completion())
+    result = asyncio.run(index.score_essay_by_criterion(f"{TOPIC}\n\n{BODY}", "text:criterion-merge"))
+
+    assert result.topic == TOPIC
+    assert result.score.model_dump() == {"overall_band": 6.5, **SCORES}
+    assert result.feedback.task_response == "task_response feedback"
+    assert result.suggestions == [f"{key} suggestion" for key in SCORES]
+    # The topic copied from the essay is not counted or repeated as essay text
+    assert result.original_essay == BODY
+    assert result.word_count == 12
+    assert asyncio.run(get_cache().get("text:criterion-merge")) == result.model_dump_json()
+
+
+def test_a_missing_criterion_fails_the_evaluation(monkeypatch):
+    monkeypatch.setattr(index, "parse_completion", fake_parse_completion(missing=("lexical_resource",)))
+    with pytest.raises(ValueError, match="lexical_resource"):
+        asyncio.run(index.score_essay_by_criterion(f"{TOPIC}\n\n{BODY}", "text:criterion-missing"))
+
+
+@pytest.mark.parametrize("scores, overall", [
+    ([6, 6, 6, 6], 6),
+    ([6, 6, 6, 7], 6.5),  # 6.25 rounds up to the half band
+    ([6, 6.5, 6, 6], 6),  # 6.125 rounds down
+    ([7, 7, 7, 6], 7),  # 6.75 rounds up to the whole band
+    ([7, 6.5, 7, 6], 6.5),
+])
+def test_overall_band_rounding(scores, overall):
+    result = index.IELTSWritingEvaluation.from_essay(
+        TOPIC, BODY, dict(zip(SCORES, scores)), {key: "" for key in SCORES}, []
+    )
+    assert result.score.overall_band == overall
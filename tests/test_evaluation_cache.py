@@ -0,0 +1,105 @@
+import asyncio
+
+from api.services import evaluation_cache
+from api.services.evaluation_cache import EvaluationCache, make_cache_key
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_cache_key_ignores_whitespace_only_edits():
+    a = make_cache_key("text", "Topic\n\nFirst  line.\n\n\n\nSecond line. ", "gpt-4o", "1")
+    b = make_cache_key("text", "Topic\n\nFirst line.\n\nSecond line.", "gpt-4o", "1")
+    assert a == b
+    assert a != make_cache_key("text", "Topic\nFirst line.\nSecond line.", "gpt-4o", "1")
+    assert a != make_cache_key("text", "Topic\n\nFirst line.\n\nSecond line.", "gpt-4o", "2")
+
+
+def test_lru_evicts_by_entries_and_bytes():
+    async def scenario():
+        cache = EvaluationCache(max_entries=2, max_bytes=10)
+        await cache.set("a", "1234")
+        await cache.set("b", "1234")
+        await cache.get("a")  # "b" is now least recently used
+        await cache.set("c", "1234")
+        return cache, [await cache.get(k) for k in ("a", "b", "c")]
+
+    cache, values = run(scenario())
+    assert values == ["1234", None, "1234"]
+    assert cache.counters["evictions"] == 1
+
+    async def by_bytes():
+        cache = EvaluationCache(max_entries=10, max_bytes=10)
+        await cache.set("a", "123456")
+        await cache.set("b", "123456")
+        return await cache.get("a"), await cache.get("b")
+
+    assert run(by_bytes()) == (None, "123456")
+
+
+def test_expired_entries_are_served_only_when_stale_is_allowed(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(evaluation_cache, "time", clock)
+
+    async def scenario():
+        cache = EvaluationCache(ttl=10, stale_ttl=100)
+        await cache.set("key", "value")
+        clock.now += 50
+        fresh, stale = await cache.get("key"), await cache.get("key", allow_stale=True)
+        clock.now += 100
+        return fresh, stale, await cache.get("key", allow_stale=True), cache.stats()
+
+    fresh, stale, gone, stats = run(scenario())
+    assert (fresh, stale, gone) == (None, "value", None)
+    assert stats["stale_hits"] == 1
+    assert stats["entries"] == 0
+
+
+def test_disk_tier_is_shared_and_promotes_hits(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+
+    async def scenario():
+        writer = EvaluationCache(db_path=path)
+        await writer.set("text:key", "value")
+        reader = EvaluationCache(db_path=path)
+        first = await reader.get("text:key")
+        second = await reader.get("text:key")
+        return first, second, reader.counters
+
+    first, second, counters = run(scenario())
+    assert first == second == "value"
+    assert counters["disk_hits"] == 1 and counters["memory_hits"] == 1
+
+
+def test_invalidate_by_key_and_prefix(tmp_path):
+    async def scenario():
+        cache = EvaluationCache(db_path=str(tmp_path / "cache.sqlite3"))
+        for key in ("text:a", "text:b", "image:c"):
+            await cache.set(key, "value")
+        by_key = await cache.invalidate(key="image:c")
+        by_prefix = await cache.invalidate(prefix="text:")
+        return by_key, by_prefix, cache.stats()["entries"], await cache.get("text:a")
+
+    by_key, by_prefix, entries, value = run(scenario())
+    # Memory and disk copies are both counted
+    assert by_key == 2
+    assert by_prefix == 4
+    assert entries == 0 and value is None
+
+
+def test_disabled_memory_tier_stores_nothing():
+    async def scenario():
+        cache = EvaluationCache(max_entries=0)
+        await cache.set("key", "value")
+        return await cache.get("key")
+
+    assert run(scenario()) is None
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from api.services import image_ingest
+from api.services.image_ingest import (
+    ImageTooLargeError,
+    UnsupportedImageError,
+    detect_mime_type,
+    ingest_upload,
+    optimize_image,
+)
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def encode(image, format, **options):
+    out = io.BytesIO()
+    image.save(out, format=format, **options)
+    return out.getvalue()
+
+
+def page(width, height):
+    """A white page with a dark block of "text" in the middle."""
+    image = Image.new("RGB", (width, height), "white")
+    image.paste((20, 20, 20), (width // 5, height // 5, width * 4 // 5, height * 4 // 5))
+    return image
+
+
+@pytest.mark.parametrize("header, mime_type", [
+    (b"\xff\xd8\xff\xe0\x00\x10JFIF", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n\x00\x00", "image/png"),
+    (b"GIF89a\x01\x00", "image/gif"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (b"\x00\x00\x00\x18ftypheic", "image/heic"),
+    (b"%PDF-1.7\n", None),
+    (b"", None),
+])
+def test_detect_mime_type(header, mime_type):
+    assert detect_mime_type(header) == mime_type
+
+
+def test_large_photos_are_fit_to_the_vision_limits():
+    data = encode(page(4000, 3000), "JPEG", quality=95)
+    optimized, mime_type, width, height = optimize_image(data, "image/jpeg")
+    assert mime_type == "image/jpeg"
+    assert min(width, height) <= image_ingest.DEFAULT_MAX_SHORT_SIDE
+    assert max(width, height) <= image_ingest.DEFAULT_MAX_SIDE
+    assert len(optimized) < len(data)
+    assert Image.open(io.BytesIO(optimized)).mode == "L"
+
+
+def test_exif_orientation_is_applied(monkeypatch):
+    monkeypatch.setenv("IMAGE_CROP", "0")
+    image = page(600, 400)
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 degrees clockwise to display
+    _, _, width, height = optimize_image(encode(image, "JPEG", exif=exif), "image/jpeg")
+    assert (width, height) == (400, 600)
+
+
+def test_colour_is_kept_when_grayscale_is_off(monkeypatch):
+    monkeypatch.setenv("IMAGE_GRAYSCALE", "0")
+    optimized, _, _, _ = optimize_image(encode(page(2000, 1500), "PNG"), "image/png")
+    assert Image.open(io.BytesIO(optimized)).mode == "RGB"
+
+
+def test_small_images_keep_their_original_encoding(monkeypatch):
+    monkeypatch.setenv("IMAGE_GRAYSCALE", "0")
+    data = encode(Image.new("RGB", (64, 64), "white"), "PNG")
+    assert optimize_image(data, "image/png") == (data, "image/png", 64, 64)
+
+
+def test_corrupt_images_are_rejected():
+    with pytest.raises(UnsupportedImageError):
+        optimize_image(b"\xff\xd8\xff" + b"\x00" * 64, "image/jpeg")
+
+
+def test_ingest_hashes_the_original_bytes():
+    data = encode(page(1600, 1200), "PNG")
+    image = asyncio.run(ingest_upload(UploadFile(io.BytesIO(data), filename="page.png")))
+    assert image.original_size == len(data)
+    assert image.mime_type == "image/jpeg"
+    assert image.data_url().startswith("data:image/jpeg;base64,")
+    assert image.digest == hashlib.sha256(data).hexdigest()
+
+
+def test_ingest_rejects_oversized_and_empty_uploads(monkeypatch):
+    monkeypatch.setenv("IMAGE_MAX_UPLOAD_BYTES", "10")
+    with pytest.raises(ImageTooLargeError):
+        asyncio.run(ingest_upload(UploadFile(io.BytesIO(b"x" * 11), filename="page.png")))
+    with pytest.raises(UnsupportedImageError, match="is empty"):
+        asyncio.run(ingest_upload(UploadFile(io.BytesIO(b""), filename="page.png")))
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from api.services import job_queue
+from api.services.image_ingest import IngestedImage
+from api.services.job_queue import JobQueue, JobStore, QueueFullError
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+class Output:
+    def __init__(self, text):
+        self.text = text
+
+    def model_dump_json(self):
+        return f'{{"text": "{self.text}"}}'
+
+
+def test_claim_takes_priority_then_age(store):
+    store.create("batch", "text", "b", [], "t", 1, now=1.0)
+    store.create("old", "text", "o", [], "t", 0, now=2.0)
+    store.create("new", "text", "n", [], "t", 0, now=3.0)
+    claimed = [store.claim(now=10.0, lease=60)["id"] for _ in range(3)]
+    assert claimed == ["old", "new", "batch"]
+    assert store.claim(now=10.0, lease=60) is None
+    assert store.get("old")["status"] == "running"
+    assert store.get("old")["started_at"] == 10.0
+
+
+def test_expired_leases_are_claimed_again(store):
+    store.create("job", "text", "essay", [], "t", 0, now=1.0)
+    assert store.claim(now=10.0, lease=60)["id"] == "job"
+    assert store.claim(now=69.0, lease=60) is None
+    # The worker that claimed it is presumed dead once the lease has passed
+    assert store.claim(now=71.0, lease=60)["id"] == "job"
+
+
+def test_finished_jobs_are_not_claimed_and_drop_their_images(store):
+    image = IngestedImage(b"jpeg", "image/jpeg", "digest", 100, 10, 20)
+    store.create("job", "image", None, [image], "t", 0, now=1.0)
+    (stored,) = store.images("job")
+    assert (stored.data, stored.mime_type, stored.digest, stored.width) == (b"jpeg", "image/jpeg", "digest", 10)
+    store.claim(now=2.0, lease=60)
+    store.finish("job", "succeeded", "{}", None, now=3.0)
+    assert store.images("job") == []
+    assert store.claim(now=1000.0, lease=60) is None
+    store.purge_finished(before=4.0)
+    assert store.get("job") is None
+
+
+def run_queue(store, handler, scenario, **options):
+    async def main():
+        queue = JobQueue(store, handler, workers=1, **options)
+        try:
+            return await scenario(queue)
+        finally:
+            await queue.stop()
+
+    return asyncio.run(main())
+
+
+def test_wait_returns_as_soon_as_the_job_finishes(store, monkeypatch):
+    # Polling alone would take longer than the test allows
+    monkeypatch.setattr(job_queue, "POLL_INTERVAL", 5.0)
+
+    async def handler(kind, essay_text, images):
+        await asyncio.sleep(0.05)
+        return Output(essay_text)
+
+    async def scenario(queue):
+        job_id = await queue.submit("text", "essay")
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        job = await queue.wait(job_id, timeout=3)
+        return job, loop.time() - start
+
+    job, elapsed = run_queue(store, handler, scenario)
+    assert job["status"] == "succeeded"
+    assert job["result"] == '{"text": "essay"}'
+    assert elapsed < 1.0
+
+
+def test_wait_gives_up_after_the_timeout(store):
+    release = None
+
+    async def handler(kind, essay_text, images):
+        await release.wait()
+        return Output(essay_text)
+
+    async def scenario(queue):
+        nonlocal release
+        release = asyncio.Event()
+        job_id = await queue.submit("text", "essay")
+        pending = await queue.wait(job_id, timeout=0.1)
+        release.set()
+        return pending, await queue.wait(job_id, timeout=3), await queue.wait("missing", timeout=1)
+
+    pending, finished, missing = run_queue(store, handler, scenario)
+    assert pending["status"] in ("queued", "running")
+    assert finished["status"] == "succeeded"
+    assert missing is None
+
+
+def test_failures_are_stored_with_their_message(store):
+    async def handler(kind, essay_text, images):
+        raise ValueError("The model returned no evaluation.")
+
+    async def scenario(queue):
+        job_id = await queue.submit("text", "essay")
+        return await queue.wait(job_id, timeout=3)
+
+    job = run_queue(store, handler, scenario)
+    assert (job["status"], job["error"]) == ("failed", "The model returned no evaluation.")
+
+
+def test_submissions_beyond_the_queue_limit_are_refused(store):
+    store.create("queued", "text", "essay", [], "t", 0, now=1.0)
+
+    async def scenario(queue):
+        with pytest.raises(QueueFullError) as info:
+            await queue.submit("text", "essay")
+        return info.value.retry_after
+
+    assert run_queue(store, None, scenario, max_queued=1) >= 1.0
+    assert store.count("queued") == 1
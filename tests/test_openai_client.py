@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+
+from api.services import openai_client
+from api.services.metrics import upstream_ttft_seconds
+
+
+class FakeStream:
+    def __init__(self, events):
+        self.events = events
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def __aiter__(self):
+        for event in self.events:
+            yield event
+
+    async def get_final_completion(self):
+        return SimpleNamespace(usage=None)
+
+
+def fake_client(events):
+    completions = SimpleNamespace(stream=lambda **kwargs: FakeStream(events))
+    return SimpleNamespace(beta=SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+
+
+def observations(histogram, model):
+    suffix = f'_count{{model="{model}"}} '
+    counts = [line.rsplit(" ", 1)[1] for line in histogram.render() if suffix in line]
+    return int(counts[0]) if counts else 0
+
+
+def test_stream_records_time_to_first_token_on_the_first_content_delta(monkeypatch):
+    # The SDK always sends a raw `chunk` event before the first content delta
+    events = [SimpleNamespace(type=kind) for kind in ("chunk", "content.delta", "chunk", "content.delta", "content.done")]
+    monkeypatch.setattr(openai_client, "get_client", lambda: fake_client(events))
+
+    async def consume():
+        stream = openai_client.stream_parsed_completion(
+            model="ttft-test-model", messages=[{"role": "user", "content": "Hello"}]
+        )
+        return [event.type async for event in stream]
+
+    assert asyncio.run(consume()) == [event.type for event in events]
+    assert observations(upstream_ttft_seconds, "ttft-test-model") == 1
@@ -0,0 +1,137 @@
+import pytest
+
+from api.services.prescreen import (
+    EssayRejectedError,
+    count_words,
+    essay_features,
+    essay_word_count,
+    screen_essay,
+    screen_essays,
+    split_topic,
+)
+from bench.run import synthetic_essay
+
+
+def codes(screening):
+    return [code for code, _ in screening.warnings]
+
+
+def test_count_words_splits_on_whitespace():
+    assert count_words("  Technology,  however, is\nuseful.\n\n") == 4
+    assert count_words("") == 0
+
+
+def test_features_of_a_regular_essay():
+    essay = synthetic_essay(1)
+    topic, body = essay.split("\n\n", 1)
+    f = essay_features(essay)
+    # The task question is not part of the essay
+    assert (f["word_count"], f["topic_word_count"]) == (count_words(body), count_words(topic))
+    assert f["paragraph_count"] == 4
+    assert f["duplicate_paragraphs"] == 0
+    assert f["repeated_text_ratio"] == 0.0
+    assert f["latin_script_ratio"] == 1.0
+    assert f["linking_words"] > 0
+
+
+def test_regular_essay_passes_with_warnings_only():
+    screening = screen_essay(synthetic_essay(1))
+    assert screening.rejection is None
+    screening.raise_if_rejected()
+    assert "under_length" in codes(screening)
+
+
+def test_too_short_essay_is_rejected():
+    with pytest.raises(EssayRejectedError) as info:
+        screen_essay("Technology is good for everyone.").raise_if_rejected()
+    assert info.value.reason == "too_short"
+    assert info.value.features["word_count"] == 5
+
+
+def test_non_latin_script_is_rejected():
+    assert screen_essay("Технологии играют важную роль в нашей жизни " * 20).rejection[0] == "charset"
+
+
+def test_non_english_latin_text_is_rejected():
+    text = "Je pense que la technologie est très importante pour notre société moderne et les jeunes. " * 8
+    assert screen_essay(text).rejection[0] == "language"
+
+
+def test_pasted_essay_is_rejected_as_duplicate():
+    text = "\n\n".join([synthetic_essay(2)] * 3)
+    assert screen_essay(text).rejection[0] == "duplicate"
+
+
+def test_numbered_paragraphs_are_not_duplicates():
+    body = "\n\n".join(
+        f"Point {i}: people in the city like to travel, however the cost of it is high for families." for i in range(6)
+    )
+    assert essay_features(body)["duplicate_paragraphs"] == 0
+
+
+def test_linking_phrases_count_once():
+    f = essay_features("On the other hand, for example, as a result of this, in conclusion it works.")
+    assert f["linking_words"] == 4
+
+
+def test_min_words_setting(monkeypatch):
+    monkeypatch.setenv("PRESCREEN_MIN_WORDS", "3")
+    assert screen_essay("Technology is good for everyone.").rejection is None
+
+
+def test_reject_disabled_turns_problems_into_warnings(monkeypatch):
+    monkeypatch.setenv("PRESCREEN_REJECT", "0")
+    screening = screen_essay("Technology is good.")
+    assert screening.rejection is None
+    assert "too_short" in codes(screening)
+
+
+def test_screen_essays_keeps_order():
+    results = screen_essays(["Too short.", synthetic_essay(3)])
+    assert results[0].rejection[0] == "too_short"
+    assert results[1].rejection is None
+
+
+def test_to_dict_and_prompt_note():
+    screening = screen_essay(synthetic_essay(4))
+    data = screening.to_dict()
+    assert set(data) == {"features", "warnings"}
+    assert all(set(w) == {"code", "message"} for w in data["warnings"])
+    assert f"{data['features']['word_count']} words (not counting the" in screening.prompt_note()
+    assert "no task question found" in screen_essay(synthetic_essay(4).split("\n\n", 1)[1]).prompt_note()
+
+
+QUESTION = (
+    "Some people believe that university students should pay the full cost of their studies, while others "
+    "think tertiary education should be free. Discuss both views and give your own opinion."
+)
+
+
+@pytest.mark.parametrize("first", [
+    QUESTION,
+    "Is technology making us less social?",
+    "Topic: the internet\nand children",
+    "Technology and Society",
+])
+def test_split_topic_finds_the_task_question(first):
+    assert split_topic(f"{first}\n\nThe essay starts here.\n\nIt goes on.") == (
+        first, "The essay starts here.\n\nIt goes on."
+    )
+
+
+@pytest.mark.parametrize("text", [
+    "In recent years technology has changed how we live. Many argue it helps more than it harms.\n\nIt goes on.",
+    "Is technology making us less social?",
+    " ".join(["Why"] * 81) + "?\n\nIt goes on.",
+])
+def test_split_topic_keeps_essays_without_one(text):
+    assert split_topic(text) == ("", text.strip())
+
+
+def test_length_check_ignores_the_question():
+    essay = synthetic_essay(5)
+    body = " ".join(essay.split("\n\n", 1)[1].split()[:235])
+    screening = screen_essay(f"{QUESTION}\n\n{body}")
+    assert screening.features["word_count"] == essay_word_count(f"{QUESTION}\n\n{body}") == 235
+    assert screening.features["topic_word_count"] == count_words(QUESTION)
+    assert "under_length" in codes(screening)
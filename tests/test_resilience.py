@@ -0,0 +1,87 @@
+import pytest
+
+from api.services import resilience
+from api.services.resilience import CircuitBreaker, CircuitOpenError, LatencyTracker, backoff_delay
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, "time", clock)
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("model", failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as info:
+        breaker.before_call()
+    assert info.value.retry_after == 30
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("model", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("model", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_the_circuit(clock):
+    breaker = CircuitBreaker("model", failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 31
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_released_probe_allows_another(clock):
+    breaker = CircuitBreaker("model", failure_threshold=1, reset_timeout=1)
+    breaker.record_failure()
+    clock.now += 1
+    breaker.before_call()
+    breaker.release_probe()
+    breaker.before_call()
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, 0.5, 8.0) <= 8.0
+
+
+def test_latency_quantile_needs_enough_samples():
+    tracker = LatencyTracker()
+    for i in range(10):
+        tracker.add(i)
+    assert tracker.quantile(0.9) is None
+    for i in range(10, 100):
+        tracker.add(i)
+    assert tracker.quantile(0.9) == 90
@@ -0,0 +1,51 @@
+import os
+
+from api.services.rubric_evaluator import RubricRegistry, criterion_key, rubric_data
+
+HEADER = "Criteria,Description,Band 9\n"
+
+
+def registry_for(tmp_path, monkeypatch, text):
+    path = tmp_path / "rubric.csv"
+    path.write_text(text, encoding="utf-8")
+    monkeypatch.setenv("RUBRIC_PATH", str(path))
+    return RubricRegistry(), path
+
+
+def test_built_in_rubric_without_a_path(monkeypatch):
+    monkeypatch.delenv("RUBRIC_PATH", raising=False)
+    registry = RubricRegistry()
+    assert registry.rubric() is rubric_data
+    assert registry.criteria() == [
+        "task_response", "coherence_and_cohesion", "lexical_resource", "grammatical_range_and_accuracy",
+    ]
+
+
+def test_csv_rubric_is_loaded(tmp_path, monkeypatch):
+    registry, _ = registry_for(tmp_path, monkeypatch, HEADER + "Task Response,desc,b9\n")
+    assert registry.rubric() == {"Criteria": ["Task Response"], "Description": ["desc"], "Band 9": ["b9"]}
+    assert "- **Band 9**: b9" in registry.criterion_prompt("task_response")
+
+
+def test_extra_fields_beyond_the_header_are_ignored(tmp_path, monkeypatch):
+    registry, _ = registry_for(tmp_path, monkeypatch, HEADER + "Task Response,desc,b9,EXTRA\n")
+    assert registry.rubric()["Band 9"] == ["b9"]
+
+
+def test_invalid_csv_falls_back_to_the_previous_rubric(tmp_path, monkeypatch):
+    registry, path = registry_for(tmp_path, monkeypatch, HEADER + "Task Response,desc,b9\n")
+    previous = registry.rubric()
+    mtime = path.stat().st_mtime_ns
+    path.write_text("Name,Text\nx,y\n", encoding="utf-8")
+    os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+    assert registry.rubric() is previous
+
+
+def test_invalid_csv_falls_back_to_the_built_in_rubric(tmp_path, monkeypatch):
+    registry, _ = registry_for(tmp_path, monkeypatch, "Name,Text\nx,y\n")
+    assert registry.rubric() is rubric_data
+
+
+def test_criterion_key():
+    assert criterion_key("Coherence & Cohesion") == "coherence_and_cohesion"
+    assert criterion_key("Grammatical Range & Accuracy") == "grammatical_range_and_accuracy"
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from api.services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_call():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*[flights.do("key", call) for _ in range(5)])
+        return flights, calls, results
+
+    flights, calls, results = asyncio.run(scenario())
+    assert calls == 1
+    assert results == ["result"] * 5
+    assert flights.stats() == {"calls": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def call(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(flights.do("a", lambda: call(1)), flights.do("b", lambda: call(2)))
+
+    assert asyncio.run(scenario()) == [1, 2]
+
+
+def test_exceptions_reach_every_waiter():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        return await asyncio.gather(*[flights.do("key", call) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_a_cancelled_waiter_does_not_cancel_the_shared_call():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.ensure_future(flights.do("key", call))
+        second = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_key_is_released_after_the_call():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        await flights.do("key", call)
+        await flights.do("key", call)
+        return calls
+
+    assert asyncio.run(scenario()) == 2
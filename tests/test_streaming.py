@@ -0,0 +1,45 @@
+import json
+
+from api.services.streaming import PartialFieldTracker, ndjson_line
+
+
+def paths(events):
+    return [event["path"] for event in events]
+
+
+def test_values_are_emitted_once_settled():
+    tracker = PartialFieldTracker()
+    assert tracker.update({"topic": "Tech"}) == []
+    assert paths(tracker.update({"topic": "Technology", "score": {"task_response": 6.}})) == ["topic"]
+    events = tracker.update({"topic": "Technology", "score": {"task_response": 6.5, "lexical_resource": 7}})
+    assert events == [{"type": "field", "path": "score.task_response", "value": 6.5}]
+
+
+def test_list_items_settle_when_the_next_item_starts():
+    tracker = PartialFieldTracker()
+    assert tracker.update({"suggestions": ["Use more"]}) == []
+    assert paths(tracker.update({"suggestions": ["Use more examples", "Vary"]})) == ["suggestions.0"]
+
+
+def test_finish_emits_the_rest_without_duplicates():
+    tracker = PartialFieldTracker()
+    tracker.update({"topic": "Technology", "word_count": 25})
+    events = tracker.finish({"topic": "Technology", "word_count": 250, "error": None})
+    assert paths(events) == ["word_count", "error"]
+    assert events[0]["value"] == 250
+    assert tracker.finish({"topic": "Technology", "word_count": 250, "error": None}) == []
+
+
+def test_skipped_fields_are_never_emitted():
+    tracker = PartialFieldTracker(skip=("word_count",))
+    assert paths(tracker.finish({"topic": "Technology", "word_count": 250})) == ["topic"]
+
+
+def test_non_object_snapshots_are_ignored():
+    assert PartialFieldTracker().update(None) == []
+
+
+def test_ndjson_line():
+    line = ndjson_line({"type": "field", "path": "topic", "value": "Ünïcode"})
+    assert line.endswith(b"\n") and line.count(b"\n") == 1
+    assert json.loads(line) == {"type": "field", "path": "topic", "value": "Ünïcode"}
@@ -0,0 +1,84 @@
+import base64
+import io
+
+import pytest
+
+from api.services.token_budget import (
+    IMAGE_TOKENS,
+    InputTooLargeError,
+    _image_size,
+    check_essay,
+    image_tokens,
+    output_tokens,
+    prompt_tokens,
+)
+
+
+def data_url(data, mime_type="image/png"):
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def encoded(width, height, format, **options):
+    Image = pytest.importorskip("PIL.Image")
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(out, format=format, **options)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("width, height, tokens", [
+    (1024, 1024, 765),  # 768x768: four tiles
+    (2048, 4096, 1105),  # 1024x2048 -> 768x1536: six tiles
+    (100, 100, 255),  # small images are not scaled up
+    (768, 3000, 85 + 170 * 8),  # fit within 2048 first: 524x2048, eight tiles
+])
+def test_image_tokens(width, height, tokens):
+    assert image_tokens(width, height) == tokens
+
+
+def test_image_size_of_png_and_jpeg():
+    assert _image_size(data_url(encoded(640, 480, "PNG"))) == (640, 480)
+    assert _image_size(data_url(encoded(320, 1200, "JPEG"), "image/jpeg")) == (320, 1200)
+    Image = pytest.importorskip("PIL.Image")
+    exif = Image.Exif()
+    exif[0x010E] = "a page of handwriting" * 20
+    jpeg = encoded(800, 600, "JPEG", exif=exif, progressive=True)
+    assert _image_size(data_url(jpeg, "image/jpeg")) == (800, 600)
+
+
+@pytest.mark.parametrize("url", [
+    "https://example.com/page.png",
+    "data:image/png,notbase64",
+    "data:image/png;base64,!!!!",
+    data_url(b"GIF89a\x01\x00\x01\x00"),
+    data_url(b"\x89PNG\r\n\x1a\n"),
+])
+def test_image_size_unknown(url):
+    assert _image_size(url) is None
+
+
+def test_prompt_tokens_by_part():
+    messages = [
+        {"role": "system", "content": "You are an examiner."},
+        {"role": "user", "content": [
+            {"type": "text", "text": "Transcribe this page."},
+            {"type": "image_url", "image_url": {"url": data_url(encoded(1024, 1024, "PNG"))}},
+            {"type": "image_url", "image_url": {"url": "https://example.com/page.png"}},
+            {"type": "image_url", "image_url": {"url": "https://example.com/page.png", "detail": "low"}},
+        ]},
+    ]
+    parts = prompt_tokens(messages, "gpt-4o")
+    assert parts["image"] == 765 + IMAGE_TOKENS + 85
+    assert parts["system"] > 4 and parts["input"] > 7
+    assert parts["schema"] == 0
+
+
+def test_output_tokens_leave_room_for_the_echoed_essay():
+    assert output_tokens(800) == 1000
+    assert output_tokens(800, "word " * 400) > output_tokens(800)
+
+
+def test_check_essay(monkeypatch):
+    monkeypatch.setenv("MAX_ESSAY_TOKENS", "50")
+    assert check_essay("A short essay.") > 0
+    with pytest.raises(InputTooLargeError):
+        check_essay("word " * 500)